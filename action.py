@@ -128,7 +128,10 @@ class ActionSet(frozenset):
             iterable = reduce(ActionSet.union,list(elements.values()),ActionSet())
         else:
             iterable = elements
-        return frozenset.__new__(cls,iterable)
+        result = frozenset.__new__(cls,iterable)
+        result._string = None
+        result._hash = None
+        return result
 
     def match(self,pattern):
         """
@@ -158,14 +161,42 @@ class ActionSet(frozenset):
         return result
 
     def __str__(self):
-        return ','.join(map(str,self))
+        if self._string is None:
+            self._string = ','.join(map(str,self))
+        return self._string
 
     def __hash__(self):
-        return hash(str(self))
+        if self._hash is None:
+            self._hash = frozenset.__hash__(self)
+        return self._hash
+
+    def __eq__(self,other):
+        if self is other:
+            return True
+        elif isinstance(other,ActionSet) and self._hash is not None and other._hash is not None and self._hash != other._hash:
+            return False
+        else:
+            return frozenset.__eq__(self,other)
+
+    def __ne__(self,other):
+        return not self == other
+
+    def __reduce__(self):
+        # Leave out the cached hash, which need not hold in another process
+        return (self.__class__,(frozenset(self),))
 
     def __lt__(self,other):
         return str(self) < str(other)
 
+    def union(self,*others):
+        return self.__class__(frozenset.union(self,*others))
+
+    def __or__(self,other):
+        if isinstance(other,frozenset) or isinstance(other,set):
+            return self.union(other)
+        else:
+            return NotImplemented
+
     def agentLess(self):
         """
         Utility method that returns a subject-independent version of this action set
@@ -181,6 +212,63 @@ class ActionSet(frozenset):
             root.appendChild(atom.__xml__().documentElement)
         return doc
 
+class ActionRegistry:
+    """
+    Interns L{ActionSet} instances, so that all equal action sets within a world share a single canonical instance (with its hash and string already computed) and a unique integer id
+    @ivar table: the canonical instance of each action set
+    @type table: L{ActionSet}S{->}L{ActionSet}
+    @ivar ids: the id of each canonical action set
+    @type ids: L{ActionSet}S{->}int
+    @ivar actions: the canonical action sets, in order of id
+    @type actions: L{ActionSet}[]
+    """
+    def __init__(self):
+        self.table = {}
+        self.ids = {}
+        self.actions = []
+
+    def intern(self,action):
+        """
+        @param action: the action(s) to intern
+        @type action: L{Action}, L{ActionSet}, or a table of L{ActionSet} by agent name
+        @return: the canonical instance of the given action set
+        @rtype: L{ActionSet}
+        """
+        if not isinstance(action,ActionSet):
+            action = ActionSet(action)
+        try:
+            return self.table[action]
+        except KeyError:
+            str(action)
+            self.table[action] = action
+            self.ids[action] = len(self.actions)
+            self.actions.append(action)
+            return action
+
+    def id(self,action):
+        """
+        @return: the integer id of the given action set (interning it if necessary)
+        @rtype: int
+        """
+        try:
+            return self.ids[action]
+        except KeyError:
+            return self.ids[self.intern(action)]
+
+    def __getitem__(self,index):
+        return self.actions[index]
+
+    def __contains__(self,action):
+        return action in self.table
+
+    def __len__(self):
+        return len(self.actions)
+
+    def clear(self):
+        self.table.clear()
+        self.ids.clear()
+        del self.actions[:]
+
 def filterActions(pattern,actions):
     """
     @type pattern: dict
@@ -2,11 +2,14 @@ import copy
 import math
 import random
 import io
+import time
 from xml.dom.minidom import Document,Node
 
 from .action import Action,ActionSet
 from .pwl import *
 from .probability import Distribution
+from .cache import LRUCache
+from . import mcts
 from functools import reduce
 
 class Agent:
@@ -29,10 +32,16 @@ class Agent:
     @type y: int
     @ivar color: color name to be used in UI
     @type color: str
+    @ivar rng: the source of random numbers for this agent's choices (a child stream of the world's, see L{World.stream})
+    @type rng: C{random.Random}
+    @cvar lookahead: the maximum number of values cached by L{value} under any model that does not set its own C{lookahead} attribute (see L{setLookahead})
+    @type lookahead: int
     """
+    lookahead = 4096
 
     def __init__(self,name):
         self.world = None
+        self.rng = random.Random()
         self.actions = set()
         self.legal = {}
         self.omega = set()
@@ -52,11 +61,46 @@ class Agent:
             self.addModel(True,R={},horizon=2,level=2,rationality=1.,discount=1.,selection='consistent',
                           beliefs=True,parent=None,projector=Distribution.expectation)
 
+    def fork(self,world):
+        """
+        @param world: the world that the copy inhabits (see L{World.fork})
+        @return: a copy of me that shares my trees with me, but has its own actions, models, beliefs, and value caches
+        @rtype: L{Agent}
+        """
+        agent = self.__class__.__new__(self.__class__)
+        agent.__dict__.update(self.__dict__)
+        agent.world = world
+        agent.rng = random.Random()
+        agent.rng.setstate(self.rng.getstate())
+        agent.actions = set(self.actions)
+        agent.legal = dict(self.legal)
+        agent.omega = set(self.omega)
+        if isinstance(self.O,dict):
+            agent.O = {omega: dict(table) for omega,table in self.O.items()}
+        agent.models = {}
+        for name,model in self.models.items():
+            model = dict(model)
+            if isinstance(model.get('R'),dict):
+                model['R'] = dict(model['R'])
+            if isinstance(model.get('beliefs'),Distribution):
+                model['beliefs'] = model['beliefs'].__class__(model['beliefs'])
+            if 'V' in model:
+                model['V'] = copy.copy(model['V'])
+            if 'SE' in model:
+                model['SE'] = {belief: {real: dict(table) for real,table in entry.items()}
+                               for belief,entry in model['SE'].items()}
+            for key in ['ignore','approximation','planner','cache']:
+                if key in model:
+                    model[key] = copy.copy(model[key])
+            agent.models[name] = model
+        agent.modelList = dict(self.modelList)
+        return agent
+
     """------------------"""
     """Policy methods"""
     """------------------"""
 
-    def decide(self,vector,horizon=None,others=None,model=None,selection=None,actions=None,keys=None):
+    def decide(self,vector,horizon=None,others=None,model=None,selection=None,actions=None,keys=None,explanation=None,budget=None):
         """
         Generate an action choice for this agent in the given state
         @param vector: the current state in which the agent is making its decision
@@ -76,6 +120,17 @@ class Agent:
         @type selection: str
         @param actions: possible action choices (default is all legal actions)
         @param keys: subset of state features to project over (default is all state features)
+        @param explanation: how much of the decision to record in the result
+           - action: only the chosen action (and its value)
+           - value: also the value of each alternative action in each believed state
+           - projection: also the projected outcomes behind each value (as needed by L{World.explain} at levels above 2)
+           - C{None}: use L{World.explanation} (default)
+        @type explanation: str
+        @param budget: the maximum number of seconds to spend on this decision, in which case the decision comes from the longest horizon solved in time (see L{deepen}); C{None} means use the budget specified in the model, if any (default)
+        @type budget: float
+        @note: if the model has a planner (see L{setPlanner}), then the values of the actions are estimated by sampling, and the value function records only their expectations
+        @note: if the model prunes (see L{setPruning}), then the value function omits the actions that were found to be worse than the best one before being fully evaluated, and lists them under C{'pruned'} instead (unless the selection is C{'distribution'}, which needs the value of every action)
+        @note: if the world has an executor (see L{World.setExecutor}), then the value of each action in each possible world is computed in parallel (without any pruning)
         """
         if model is None:
             model = self.world.getModel(self.name,vector)
@@ -112,9 +167,47 @@ class Agent:
         elif len(actions) == 1:
             # Only one possible action
             return {'action': next(iter(actions))}
+        if explanation is None:
+            explanation = self.world.explanation
+        planner = self.getAttribute('planner',model)
+        if budget is None:
+            budget = self.getAttribute('budget',model)
+        if budget is not None and not planner and self.world.deadline is None:
+            return self.deepen(vector,horizon,others,model,selection,actions,keys,explanation,budget)
         # Keep track of value function
         V = {}
         best = None
+        pruned = []
+        if planner or self.world.executor is None:
+            parallel = None
+        else:
+            # Compute all of the values up front
+            tasks = []
+            for action in actions:
+                if isinstance(keys,dict):
+                    subkeys = keys[action]
+                else:
+                    subkeys = keys
+                tasks += [(state,action,subkeys) for state in belief.domain()]
+            parallel = iter(self.world.executor.evaluate(self,tasks,horizon,others,model,explanation))
+        prune = self.getAttribute('prune',model) and selection != 'distribution' and not planner and parallel is None
+        if prune:
+            # Upper bounds on the value of each possible world
+            bounds = {state: self.valueBound(horizon,model,self.reward(state,model)) for state in belief.domain()}
+            if None in bounds.values():
+                prune = False
+        if planner:
+            # Estimate values by sampling, rather than by exhaustive lookahead
+            values = mcts.search(self,belief,actions,horizon,others,model,keys,
+                                 planner.get('iterations'),planner.get('budget'),
+                                 planner.get('exploration',1.))
+            for action,value in values.items():
+                V[action] = {'__EV__': value}
+                if best is None or value > V[best[0]]['__EV__']:
+                    best = [action]
+                elif value == V[best[0]]['__EV__']:
+                    best.append(action)
+            actions = []
         for action in actions:
             # Compute value across possible worlds
             V[action] = {'__EV__': 0.}
@@ -122,18 +215,42 @@ class Agent:
                 subkeys = keys[action]
             else:
                 subkeys = keys
+            if prune:
+                optimistic = sum([belief[state]*bounds[state] for state in belief.domain()])
             for state in belief.domain():
-                V[action][state] = self.value(state,action,horizon,others,model,subkeys)
-                V[action]['__EV__'] += belief[state]*V[action][state]['V']
-            if len(V[action]) > 1:
-                # Determine whether this action is the best
-                if best is None:
-                    best = [action]
-                elif V[action]['__EV__'] == V[best[0]]['__EV__']:
-                    best.append(action)
-                elif V[action]['__EV__'] > V[best[0]]['__EV__']:
-                    best = [action]
-        result = {'V*': V[best[0]]['__EV__'],'V': V}
+                if prune and best is not None:
+                    # Below this value, this action cannot be as good as the best so far
+                    threshold = (V[best[0]]['__EV__']-1e-8-optimistic)/belief[state]+bounds[state]
+                else:
+                    threshold = None
+                if parallel is None:
+                    entry = self.value(state,action,horizon,others,model,subkeys,explanation,threshold)
+                else:
+                    entry = next(parallel)
+                if 'pruned' in entry:
+                    break
+                if explanation != 'action':
+                    V[action][state] = entry
+                V[action]['__EV__'] += belief[state]*entry['V']
+                if prune:
+                    optimistic += belief[state]*(entry['V']-bounds[state])
+            else:
+                if len(belief) > 0:
+                    # Determine whether this action is the best
+                    if best is None:
+                        best = [action]
+                    elif V[action]['__EV__'] == V[best[0]]['__EV__']:
+                        best.append(action)
+                    elif V[action]['__EV__'] > V[best[0]]['__EV__']:
+                        best = [action]
+                continue
+            del V[action]
+            pruned.append(action)
+        result = {'V*': V[best[0]]['__EV__']}
+        if explanation != 'action':
+            result['V'] = V
+        if pruned:
+            result['pruned'] = pruned
         # Make an action selection based on the value function
         if selection == 'distribution':
             values = {}
@@ -145,7 +262,9 @@ class Agent:
             # to the same unique choice
             result['action'] = best[0]
         elif selection == 'random':
-            result['action'] = random.sample(best,1)[0]
+            # Sort first, so that the choice depends only on my random number generator
+            best.sort()
+            result['action'] = self.rng.choice(best)
         elif selection == 'uniform':
             result['action'] = {}
             prob = 1./float(len(best))
@@ -157,8 +276,35 @@ class Agent:
             best.sort()
             result['action'] = best[0]
         return result
-                
-    def value(self,vector,action=None,horizon=None,others=None,model=None,keys=None):
+
+    def deepen(self,vector,horizon,others,model,selection,actions,keys,explanation,budget):
+        """
+        Anytime version of L{decide}, solving horizon 1, 2, ... in turn until either reaching the given horizon or running out of time
+        @param budget: the maximum number of seconds to spend
+        @type budget: float
+        @return: the decision from the longest horizon solved in time, which is recorded under C{'horizon'} (0 if not even a one-step lookahead finished, in which case the decision is based on the immediate reward only)
+        @rtype: dict
+        @note: the values computed at each horizon stay in the lookahead cache (see L{getLookahead}), so the longer horizons do not re-solve any state already solved with the same number of steps remaining
+        """
+        result = None
+        self.world.deadline = time.time()+budget
+        try:
+            for depth in range(1,horizon+1):
+                try:
+                    decision = self.decide(vector,depth,others,model,selection,actions,keys,explanation)
+                except TimeoutError:
+                    break
+                result = decision
+                result['horizon'] = depth
+            if result is None:
+                # Immediate reward alone does not need any lookahead
+                result = self.decide(vector,0,others,model,selection,actions,keys,explanation)
+                result['horizon'] = 0
+        finally:
+            self.world.deadline = None
+        return result
+
+    def value(self,vector,action=None,horizon=None,others=None,model=None,keys=None,explanation=None,threshold=None):
         """
         Computes the expected value of a state vector (and optional action choice) to this agent
         @param vector: the state vector (not distribution) representing the possible world under consideration
@@ -171,9 +317,15 @@ class Agent:
         @type others: strS{->}L{ActionSet}
         @param model: the model of this agent to use (default is C{True})
         @param keys: subset of state features to project over in computing future value (default is all state features)
+        @param explanation: if C{'projection'}, then record the projected outcomes in the result; otherwise, just compute the value (default is L{World.explanation})
+        @type explanation: str
+        @param threshold: if the value is sure to fall below this threshold, then the lookahead may stop short and return only an upper bound on the value, marked by a C{'pruned'} entry in the result (default is C{None}, i.e., always compute the exact value)
+        @type threshold: float
         """
         if model is None:
             model = self.world.getModel(self.name,vector)
+        if explanation is None:
+            explanation = self.world.explanation
         # Determine horizon
         if horizon is None:
             horizon = self.getAttribute('horizon',model)
@@ -184,16 +336,31 @@ class Agent:
         result = {'R': R,
                   'agent': self.name,
                   'state': vector,
-                  'horizon': horizon,
-                  'projection': []}
+                  'horizon': horizon}
+        if explanation == 'projection':
+            result['projection'] = []
         # Check for pre-computed value function
         V = self.getAttribute('V',model).get(self.name,vector,action,horizon,
                                              self.getAttribute('ignore',model))
+        if V is None:
+            # Check for value computed by a previous lookahead
+            cache = self.getLookahead(model)
+            index = (vector.freeze(),action,horizon)
+            V = cache.get(index)
+        if V is None and threshold is not None:
+            bound = self.valueBound(horizon,model,R)
+            if bound is not None and bound < threshold:
+                # Not worth looking ahead
+                V = bound
+                result['pruned'] = True
         if V is not None:
             result['V'] = V
         else:
             result['V'] = R
             if horizon > 0 and not self.world.terminated(vector):
+                if self.world.deadline is not None and time.time() > self.world.deadline:
+                    # Abandon this lookahead (see L{deepen})
+                    raise TimeoutError('%s ran out of time to decide' % (self.name))
                 # Perform action(s)
                 if others is None:
                     turn = {}
@@ -201,25 +368,51 @@ class Agent:
                     turn = copy.copy(others)
                 if not action is None:
                     turn[self.name] = action
-                outcome = self.world.stepFromState(vector,turn,horizon,keys=keys)
+                outcome = self.world.stepFromState(vector,turn,horizon,keys=keys,explanation=explanation)
                 if 'new' not in outcome:
                     # No consistent outcome
                     pass
                 elif isinstance(outcome['new'],Distribution):
                     # Uncertain outcomes
                     future = Distribution()
+                    # The following is typically "expectation", but might be "max" or "min", too
+                    op = self.getAttribute('projector',model)
+                    if op is Distribution.expectation:
+                        target = self.futureThreshold(threshold,R,discount)
+                    else:
+                        target = None
+                    if target is not None:
+                        # Bound the expected future value by the outcomes so far and the best possible rest
+                        hi = self.valueBound(horizon-1,model)
+                        if hi is None:
+                            target = None
+                    if target is not None:
+                        remaining = sum([outcome['new'][newVector] for newVector in outcome['new'].domain()])
+                        partial = 0.
                     for newVector in outcome['new'].domain():
-                        entry = copy.copy(outcome)
-                        entry['probability'] = outcome['new'][newVector]
-                        Vrest = self.value(newVector,None,horizon-1,None,model,keys)
-                        entry.update(Vrest)
+                        prob = outcome['new'][newVector]
+                        if target is None:
+                            subthreshold = None
+                        else:
+                            remaining -= prob
+                            subthreshold = (target-partial-remaining*hi)/prob
+                        Vrest = self.value(newVector,None,horizon-1,None,model,keys,explanation,subthreshold)
                         try:
-                            future[entry['V']] += entry['probability']
+                            future[Vrest['V']] += prob
                         except KeyError:
-                            future[entry['V']] = entry['probability']
-                        result['projection'].append(entry)
-                    # The following is typically "expectation", but might be "max" or "min", too
-                    op = self.getAttribute('projector',model)
+                            future[Vrest['V']] = prob
+                        if explanation == 'projection':
+                            entry = copy.copy(outcome)
+                            entry['probability'] = prob
+                            entry.update(Vrest)
+                            result['projection'].append(entry)
+                        if target is not None:
+                            partial += prob*Vrest['V']
+                            if 'pruned' in Vrest or partial+remaining*hi < target:
+                                result['pruned'] = True
+                                break
+                    if 'pruned' in result:
+                        future = Distribution({partial+remaining*hi: 1.})
                     if discount < -1e-6:
                         # Only final value matters
                         result['V'] = op(*(future,))
@@ -228,20 +421,106 @@ class Agent:
                         result['V'] += discount*op(*(future,))
                 else:
                     # Deterministic outcome
-                    outcome['probability'] = 1.
-                    Vrest = self.value(outcome['new'],None,horizon-1,None,model,keys)
-                    outcome.update(Vrest)
+                    Vrest = self.value(outcome['new'],None,horizon-1,None,model,keys,explanation,
+                                       self.futureThreshold(threshold,R,discount))
+                    if 'pruned' in Vrest:
+                        result['pruned'] = True
                     if discount < -1e-6:
                         # Only final value matters
                         result['V'] = Vrest['V']
                     else:
                         # Accumulate value
                         result['V'] += discount*Vrest['V']
-                    result['projection'].append(outcome)
-            # Do some caching
-            self.getAttribute('V',model).set(self.name,vector,action,horizon,result['V'])
+                    if explanation == 'projection':
+                        outcome['probability'] = 1.
+                        outcome.update(Vrest)
+                        result['projection'].append(outcome)
+            # Do some caching (of exact values only)
+            if cache.size != 0 and 'pruned' not in result:
+                cache[index] = result['V']
         return result
 
+    def futureThreshold(self,threshold,R,discount):
+        """
+        @return: the future value below which the value computed by L{value} falls below the given threshold, given the immediate reward and discount factor (C{None} if there is no such threshold)
+        @rtype: float
+        """
+        if threshold is None:
+            return None
+        elif discount < -1e-6:
+            # Only final value matters
+            return threshold
+        elif discount > 0.:
+            return (threshold-R)/discount
+        else:
+            return None
+
+    def rewardBounds(self,model=True):
+        """
+        @return: the lowest and highest rewards possible under the given model, given the ranges of the state features (see L{World.scaledBounds}), or C{None} if the reward depends on anything without a known range (e.g., another agent's reward)
+        @rtype: float,float
+        @note: the bounds are computed once per model and kept under C{bounds} until L{setReward} changes the reward
+        """
+        try:
+            return self.models[model]['bounds']
+        except KeyError:
+            bounds = self.computeRewardBounds(model)
+            self.models[model]['bounds'] = bounds
+            return bounds
+
+    def computeRewardBounds(self,model=True):
+        """
+        Computes the result of L{rewardBounds}, without consulting the bounds already stored in the model
+        """
+        R = self.getAttribute('R',model)
+        lo = hi = 0.
+        if R is None:
+            return lo,hi
+        for tree,weight in R.items():
+            if isinstance(tree,str):
+                return None
+            treeLo = treeHi = None
+            for leaf in tree.leaves():
+                if not isinstance(leaf,KeyedVector):
+                    return None
+                leafLo = leafHi = 0.
+                for key,coefficient in leaf.items():
+                    bounds = self.world.scaledBounds(key)
+                    if bounds is None:
+                        return None
+                    leafLo += min(coefficient*bounds[0],coefficient*bounds[1])
+                    leafHi += max(coefficient*bounds[0],coefficient*bounds[1])
+                if treeLo is None or leafLo < treeLo:
+                    treeLo = leafLo
+                if treeHi is None or leafHi > treeHi:
+                    treeHi = leafHi
+            if treeLo is not None:
+                lo += min(weight*treeLo,weight*treeHi)
+                hi += max(weight*treeLo,weight*treeHi)
+        return lo,hi
+
+    def valueBound(self,horizon,model=True,R=None):
+        """
+        @param R: the reward in the state being valued (default is the highest reward possible, see L{rewardBounds})
+        @type R: float
+        @return: an upper bound on the value computed by L{value} with the given horizon, or C{None} if the reward has no known bounds
+        @rtype: float
+        """
+        bounds = self.rewardBounds(model)
+        if bounds is None:
+            return None
+        hi = bounds[1]
+        if R is None:
+            R = hi
+        if horizon == 0:
+            return R
+        discount = self.getAttribute('discount',model)
+        if discount < -1e-6:
+            # Only final value matters (unless there is no future)
+            return max(R,hi)
+        else:
+            return R+max(0.,hi)*sum([discount**t for t in range(1,horizon+1)])
+
     def valueIteration(self,horizon=None,ignore=None,model=True,epsilon=1e-6,debug=0,maxIterations=None):
         """
         Compute a value function for the given model
@@ -362,6 +641,102 @@ class Agent:
         """
         self.setAttribute('horizon',horizon,model,level)
 
+    def setPlanner(self,method='mcts',iterations=None,budget=None,exploration=None,model=None,level=None):
+        """
+        Chooses how L{decide} estimates the values of the action choices for the given model(s)
+        @param method: either C{'mcts'} for Monte Carlo tree search (see L{mcts.search}), or C{None} for exhaustive lookahead by L{value} (default is C{'mcts'})
+        @type method: str
+        @param iterations: the maximum number of simulations per decision
+        @type iterations: int
+        @param budget: the maximum number of seconds of simulation per decision
+        @type budget: float
+        @param exploration: the weight of exploration in choosing which actions to simulate
+        @type exploration: float
+        @param model: the model to set the planner for, where C{None} means set it for all (default is C{None})
+        @param level: if setting across models, the recursive level of models to do so, where C{None} means all levels (default is C{None})
+        """
+        value = {}
+        if method is not None:
+            if method != 'mcts':
+                raise ValueError('Unknown planner: %s' % (method))
+            value['method'] = method
+            for name,setting in [('iterations',iterations),('budget',budget),('exploration',exploration)]:
+                if setting is not None:
+                    value[name] = setting
+        self.setAttribute('planner',value,model,level)
+
+    def setPruning(self,prune=True,model=None,level=None):
+        """
+        Turns on (or off) branch-and-bound pruning of actions in L{decide}, where an action is no longer evaluated once an upper bound on its value (see L{valueBound}) falls below the value of the best action so far
+        @type prune: bool
+        @param model: the model to set the pruning for, where C{None} means set it for all (default is C{None})
+        @param level: if setting across models, the recursive level of models to do so, where C{None} means all levels (default is C{None})
+        @note: pruning never changes which actions are the best, so it has no effect on the choice made under the C{'consistent'}, C{'random'}, or C{'uniform'} selection methods
+        """
+        self.setAttribute('prune',prune,model,level)
+
+    def setBudget(self,budget,model=None,level=None):
+        """
+        Bounds the time L{decide} may spend on each decision, solving successively longer horizons until the time runs out (see L{deepen})
+        @param budget: the maximum number of seconds per decision (C{None} for no bound)
+        @type budget: float
+        @param model: the model to set the budget for, where C{None} means set it for all (default is C{None})
+        @param level: if setting across models, the recursive level of models to do so, where C{None} means all levels (default is C{None})
+        """
+        self.setAttribute('budget',budget,model,level)
+
+    def setLookahead(self,size,model=None,level=None):
+        """
+        Bounds the number of values cached by L{value}, discarding the least recently used ones beyond that bound
+        @param size: the maximum number of cached values (C{None} for no bound, 0 to turn caching off)
+        @type size: int
+        @param model: the model to set the bound for, where C{None} means set it for all (default is C{None})
+        @param level: if setting across models, the recursive level of models to do so, where C{None} means all levels (default is C{None})
+        """
+        self.setAttribute('lookahead',size,model,level)
+        for name,entry in self.models.items():
+            if 'cache' in entry:
+                entry['cache'].resize(self.getAttribute('lookahead',name))
+
+    def getLookahead(self,model=True):
+        """
+        @return: the cache of values computed by L{value} under the given model (kept separate from the values solved by L{valueIteration})
+        @rtype: L{LRUCache}
+        """
+        try:
+            return self.models[model]['cache']
+        except KeyError:
+            if self.findAttribute('lookahead',model) is None:
+                size = self.lookahead
+            else:
+                size = self.getAttribute('lookahead',model)
+            self.models[model]['cache'] = LRUCache(size)
+            return self.models[model]['cache']
+
+    def lookaheadStats(self,model=None):
+        """
+        @param model: the model of interest (default is all of them)
+        @return: the counters of the lookahead cache (see L{LRUCache.stats}) of each model, along with the number of values solved by L{valueIteration}
+        @rtype: strS{->}strS{->}int
+        """
+        if model is None:
+            models = list(self.models.keys())
+        else:
+            models = [model]
+        result = {}
+        for name in models:
+            if 'cache' in self.models[name]:
+                result[name] = self.models[name]['cache'].stats()
+            else:
+                result[name] = {'size': 0,'hits': 0,'misses': 0,'evictions': 0}
+            V = self.models[name].get('V')
+            if V is None:
+                result[name]['solved'] = 0
+            else:
+                result[name]['solved'] = sum([len(values) for table in V.table
+                                              for entry in table.values() for values in entry.values()])
+        return result
+
     def setParameter(self,name,value,model=None,level=None):
         raise DeprecationWarning('Use setAttribute instead')
 
@@ -380,6 +755,21 @@ class Agent:
                     self.setAttribute(name,value,model['name'])
         else:
             self.models[model][name] = value
+            if self.world is not None:
+                self.world.revision += 1
+
+    def setApproximation(self,size=None,threshold=None,distance=None,model=None,level=None):
+        """
+        Bounds the support of the beliefs computed by L{stateEstimator} for the given model(s), as in L{World.approximate}
+        @note: the probability mass discarded is stored under C{discarded} in the resulting belief model
+        @param model: the model to set the approximation for, where C{None} means set it for all (default is C{None})
+        @param level: if setting across models, the recursive level of models to do so, where C{None} means all levels (default is C{None})
+        """
+        value = {}
+        for name,setting in [('size',size),('threshold',threshold),('distance',distance)]:
+            if setting is not None:
+                value[name] = setting
+        self.setAttribute('approximation',value,model,level)
 
     def findAttribute(self,name,model=True):
         """
@@ -430,6 +820,8 @@ class Agent:
                 # Make me the subject of these actions
                 atom['subject'] = self.name
         new = ActionSet(actions)
+        if self.world is not None:
+            new = self.world.actionRegistry.intern(new)
         self.actions.add(new)
         if condition:
             self.legal[new] = condition
@@ -468,7 +860,8 @@ class Agent:
         @param tree: the decision tree for the legality of the action
         @type tree: L{KeyedTree}
         """
-        self.legal[action] = tree.desymbolize(self.world.symbols)
+        self.legal[self.world.actionRegistry.intern(action)] = tree.desymbolize(self.world.symbols)
+        self.world.clearTransitions()
 
     def hasAction(self,atom):
         """
@@ -506,6 +899,10 @@ class Agent:
         if not isinstance(tree,str):
             tree = tree.desymbolize(self.world.symbols)
         self.models[model]['R'][tree] = weight
+        # Any model may inherit this reward
+        for entry in self.models.values():
+            entry.pop('bounds',None)
+        self.world.revision += 1
 
     def reward(self,vector=None,model=True,recurse=True):
         """
@@ -822,8 +1219,16 @@ class Agent:
         if len(newBeliefs) == 0:
             return None
         else:
-            newBeliefs.normalize()
-            index = self.belief2model(model,newBeliefs)['index']
+            approximation = self.getAttribute('approximation',model)
+            if approximation:
+                discarded = self.world.approximate(newBeliefs,**approximation)
+            else:
+                discarded = 0.
+                newBeliefs.normalize()
+            newModel = self.belief2model(model,newBeliefs)
+            if discarded > 0.:
+                newModel['discarded'] = discarded
+            index = newModel['index']
 #            self.models[model]['SE'][oldBelief][newReal][omega] = index
             return index
 
@@ -1030,8 +1435,13 @@ class Agent:
                     subnode = doc.createElement(key)
                     subnode.setAttribute('value',str(model[key]))
                     node.appendChild(subnode)
-                elif key == 'SE':
-                    # We don't serialize state estimator caching right now
+                elif key == 'approximation' or key == 'planner':
+                    subnode = doc.createElement(key)
+                    for setting,value in model[key].items():
+                        subnode.setAttribute(setting,str(value))
+                    node.appendChild(subnode)
+                elif key == 'SE' or key == 'cache' or key == 'bounds':
+                    # We don't serialize state estimator, lookahead caching, or reward bounds right now
                     pass
                 else:
                     subnode = doc.createElement(key)
@@ -1107,6 +1517,24 @@ class Agent:
                                 kwargs[key] = ValueFunction(subnode)
                             elif key == 'static':
                                 kwargs[key] = (str(subnode.getAttribute('value')) == str(True))
+                            elif key == 'approximation':
+                                kwargs[key] = {}
+                                for setting in ['size','threshold','distance']:
+                                    text = str(subnode.getAttribute(setting))
+                                    if text:
+                                        kwargs[key][setting] = int(text) if setting == 'size' else float(text)
+                            elif key == 'planner':
+                                kwargs[key] = {}
+                                for setting in ['method','iterations','budget','exploration']:
+                                    text = str(subnode.getAttribute(setting))
+                                    if not text:
+                                        continue
+                                    elif setting == 'method':
+                                        kwargs[key][setting] = text
+                                    elif setting == 'iterations':
+                                        kwargs[key][setting] = int(text)
+                                    else:
+                                        kwargs[key][setting] = float(text)
                             else:
                                 if key == 'R' and str(subnode.getAttribute('name')):
                                     if key not in kwargs:
@@ -1141,6 +1569,12 @@ class Agent:
                                                 kwargs[key] = True
                                             elif key == 'horizon':
                                                 kwargs[key] = int(text)
+                                            elif key == 'lookahead':
+                                                kwargs[key] = None if text == str(None) else int(text)
+                                            elif key == 'prune':
+                                                kwargs[key] = False
+                                            elif key == 'budget':
+                                                kwargs[key] = None if text == str(None) else float(text)
                                             elif key == 'projector':
                                                 kwargs[key] = eval('Distribution.%s' % (text))
                                             else:
@@ -1177,6 +1611,12 @@ class ValueFunction:
         if xml:
             self.parse(xml)
 
+    def __copy__(self):
+        result = self.__class__()
+        result.table = [{state: {name: dict(values) for name,values in entry.items()}
+                         for state,entry in V.items()} for V in self.table]
+        return result
+
     def get(self,name,state,action,horizon,ignore=None):
         try:
             V = self.table[horizon]
@@ -1207,7 +1647,7 @@ class ValueFunction:
             except IndexError:
                 self.table.append({})
         if state not in V:
-            V[state] = {}
+            V[state.freeze()] = {}
         if name not in V[state]:
             V[state][name] = {}
         V[state][name][action] = value
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    A table of bounded size that discards its least recently used entries once full
+    @ivar size: the maximum number of entries to keep (C{None} if unbounded)
+    @type size: int
+    @ivar hits: the number of lookups that found an entry
+    @type hits: int
+    @ivar misses: the number of lookups that did not find an entry
+    @type misses: int
+    @ivar evictions: the number of entries discarded to stay within the size bound
+    @type evictions: int
+    """
+    def __init__(self,size=1024):
+        self.size = size
+        self.table = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self,key,default=None):
+        """
+        @return: the entry for the given key (marking it as most recently used), or the given default if there is none
+        """
+        try:
+            value = self.table[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.table.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __getitem__(self,key):
+        value = self.get(key,self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self,key,value):
+        self.table[key] = value
+        self.table.move_to_end(key)
+        if self.size is not None:
+            while len(self.table) > self.size:
+                self.table.popitem(last=False)
+                self.evictions += 1
+
+    def __delitem__(self,key):
+        del self.table[key]
+
+    def __contains__(self,key):
+        return key in self.table
+
+    def __len__(self):
+        return len(self.table)
+
+    def clear(self):
+        """
+        Discards all entries (but keeps the counters)
+        """
+        self.table.clear()
+
+    def resize(self,size):
+        """
+        Changes the maximum number of entries, discarding the least recently used ones beyond the new bound
+        @type size: int
+        """
+        self.size = size
+        if size is not None:
+            while len(self.table) > size:
+                self.table.popitem(last=False)
+                self.evictions += 1
+
+    def __copy__(self):
+        """
+        @return: a new cache with the same entries (and fresh counters)
+        """
+        result = self.__class__(self.size)
+        result.table.update(self.table)
+        return result
+
+    def stats(self):
+        """
+        @return: the current counters, along with the number of entries
+        @rtype: strS{->}int
+        """
+        return {'size': len(self.table),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
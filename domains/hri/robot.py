@@ -23,6 +23,9 @@ import psychsim.probability
 
 from robotWaypoints import WAYPOINTS
 
+# Parsed scenario files, indexed by file name, along with their modification time
+_scenarios = {}
+
 TEMPLATES = {
     # TODO: Positive/negative framing
     # TODO: Sensor model
@@ -480,6 +483,21 @@ def getFilename(session=0,level=0,extension='xml',root='.'):
     """
     return os.path.join(root,'%s_%d.%s' % (session,level,extension))
 
+def loadScenario(filename):
+    """
+    @return: a fresh copy of the world in the given scenario file, parsing the file only if it has changed since the last call
+    @rtype: L{World}
+    """
+    mtime = os.path.getmtime(filename)
+    try:
+        world,when = _scenarios[filename]
+    except KeyError:
+        when = None
+    if when != mtime:
+        world = World(filename)
+        _scenarios[filename] = (world,mtime)
+    return world.fork()
+
 def maxLevels():
     """
     @return: the number of levels defined
@@ -498,7 +516,7 @@ def GetDecision(username,level,parameters,world=None,ext='xml',root='.',sleep=No
     filename = getFilename(username,level,ext,root)
     if world is None:
         # Get the world from the scenario file
-        world = World(filename)
+        world = loadScenario(filename)
     oldVector = world.state[None].domain()[0]
     
     robot = world.agents['robot']
@@ -553,11 +553,12 @@ def scenarioSimulationUseCase(world,offer=0,rounds=1,debug=1,model='powell'):
 def findThreshold(scenario,t,model='powell',position=0):
     """
     Finds the threshold at which the agent will accept the offer"""
+    original = World(scenario)
     if model == 'slantchev':
         # Find counteroffer in this state
         actions = []
         while len(actions) < 2:
-            world = World(scenario)
+            world = original.fork()
             world.setState(None,'round',t)
             world.setState('Freedonia','position',position)
             entry = {}
@@ -571,7 +572,7 @@ def findThreshold(scenario,t,model='powell',position=0):
     index = 0
     entry = {}
     while True:
-        world = World(scenario)
+        world = original.fork()
         world.setState(None,'round',t)
         if model == 'slantchev':
             world.setState('Freedonia','position',position)
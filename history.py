@@ -0,0 +1,175 @@
+import collections
+import json
+
+from .action import Action,ActionSet
+from .probability import Distribution
+from .pwl.vector import KeyedVector,VectorDistribution
+
+class RingHistory(collections.deque):
+    """
+    An in-memory step history that keeps only the most recent steps
+    @ivar size: the maximum number of steps to keep (C{None} if unbounded)
+    @type size: int
+    """
+    def __init__(self,size=None,entries=[]):
+        """
+        @param size: the maximum number of steps to keep (default is C{None}, i.e., keep every step)
+        @type size: int
+        @param entries: any steps to start with (only the last C{size} of them are kept)
+        """
+        collections.deque.__init__(self,entries,size)
+
+    @property
+    def size(self):
+        return self.maxlen
+
+    def __copy__(self):
+        return self.__class__(self.maxlen,self)
+
+class LogHistory:
+    """
+    A step history written to an append-only file, one line of JSON per step, and read back lazily on demand. Only the state vectors, actions, and probability of each outcome are recorded; the decisions and effect matrices are not.
+    @ivar filename: the name of the log file
+    @type filename: str
+    @ivar offsets: the position of each step within the log file
+    @type offsets: int[]
+    """
+    def __init__(self,filename,append=False):
+        """
+        @param filename: the name of the log file
+        @type filename: str
+        @param append: if C{True}, then keep any steps already in the given file; otherwise, start a new log (default is C{False})
+        @type append: bool
+        """
+        self.filename = filename
+        self.offsets = []
+        if append:
+            self.log = open(filename,'ab+')
+            self.log.seek(0)
+            position = 0
+            for line in self.log:
+                self.offsets.append(position)
+                position += len(line)
+        else:
+            self.log = open(filename,'wb+')
+
+    def append(self,outcomes):
+        """
+        Writes the outcomes of a single step to the end of the log
+        @param outcomes: the return value of L{World.step}
+        @type outcomes: dict[]
+        """
+        line = json.dumps([encodeOutcome(outcome) for outcome in outcomes],separators=(',',':'))
+        self.log.seek(0,2)
+        self.offsets.append(self.log.tell())
+        self.log.write(line.encode('utf-8'))
+        self.log.write(b'\n')
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        self.log.flush()
+        return readHistory(self.filename,len(self.offsets))
+
+    def __getitem__(self,index):
+        if isinstance(index,slice):
+            return [self[t] for t in range(*index.indices(len(self)))]
+        self.log.flush()
+        self.log.seek(self.offsets[index])
+        return decodeStep(self.log.readline())
+
+    def clear(self):
+        self.log.seek(0)
+        self.log.truncate()
+        del self.offsets[:]
+
+    def close(self):
+        self.log.close()
+
+    def __copy__(self):
+        """
+        @return: an in-memory copy of the steps logged so far
+        @rtype: L{RingHistory}
+        """
+        return RingHistory(None,self)
+
+def readHistory(filename,length=None):
+    """
+    Replays a log written by L{LogHistory}, one step at a time
+    @param length: the maximum number of steps to read (default is all of them)
+    @type length: int
+    @return: the outcomes of each step, as returned by L{World.step} (minus the decisions and effects)
+    @rtype: generator
+    """
+    with open(filename,'rb') as log:
+        for t,line in enumerate(log):
+            if length is not None and t >= length:
+                break
+            yield decodeStep(line)
+
+def encodeVector(vector):
+    if isinstance(vector,Distribution):
+        return [[encodeVector(element),vector[element]] for element in vector.domain()]
+    else:
+        return {key: float(value) for key,value in vector.items()}
+
+def decodeVector(entry):
+    if isinstance(entry,list):
+        return VectorDistribution({KeyedVector(element): prob for element,prob in entry})
+    else:
+        return KeyedVector(entry)
+
+def encodeAction(action):
+    if isinstance(action,Distribution):
+        return {'distribution': [[encodeAction(element),action[element]] for element in action.domain()]}
+    else:
+        return [dict(atom) for atom in action]
+
+def decodeAction(entry):
+    if isinstance(entry,dict):
+        result = Distribution()
+        for element,prob in entry['distribution']:
+            result[decodeAction(element)] = prob
+        return result
+    else:
+        return ActionSet([Action(atom) for atom in entry])
+
+def encodeOutcome(outcome):
+    """
+    @return: a JSON-serializable version of the given step outcome
+    @rtype: dict
+    """
+    entry = {}
+    for field in ['old','new','delta']:
+        if field in outcome:
+            entry[field] = encodeVector(outcome[field])
+    if 'actions' in outcome:
+        if isinstance(outcome['actions'],dict):
+            entry['actions'] = {name: encodeAction(action) for name,action in outcome['actions'].items()}
+        else:
+            entry['actions'] = encodeAction(outcome['actions'])
+    if 'probability' in outcome:
+        entry['probability'] = float(outcome['probability'])
+    return entry
+
+def decodeOutcome(entry):
+    """
+    @return: the step outcome encoded by L{encodeOutcome}
+    @rtype: dict
+    """
+    outcome = {'decisions': {}}
+    for field in ['old','new','delta']:
+        if field in entry:
+            outcome[field] = decodeVector(entry[field])
+    if 'actions' in entry:
+        if isinstance(entry['actions'],dict):
+            outcome['actions'] = {name: decodeAction(action) for name,action in entry['actions'].items()}
+        else:
+            outcome['actions'] = decodeAction(entry['actions'])
+    if 'probability' in entry:
+        outcome['probability'] = entry['probability']
+    return outcome
+
+def decodeStep(line):
+    return [decodeOutcome(entry) for entry in json.loads(line)]
@@ -0,0 +1,191 @@
+"""
+Monte Carlo tree search (UCT) for estimating the values of an agent's action choices, as an alternative to the exhaustive lookahead of L{Agent.value<psychsim.agent.Agent.value>}
+"""
+import math
+import time
+
+from .probability import Distribution
+
+class Node:
+    """
+    The statistics gathered for one state (at one remaining horizon) of the search tree
+    @ivar visits: the number of simulations passing through this node
+    @type visits: int
+    @ivar counts: the number of simulations choosing each action at this node
+    @type counts: L{ActionSet<psychsim.action.ActionSet>}S{->}int
+    @ivar totals: the sum of the returns of the simulations choosing each action at this node
+    @type totals: L{ActionSet<psychsim.action.ActionSet>}S{->}float
+    @ivar children: the node reached by each sampled outcome of each action
+    @type children: dict
+    """
+    def __init__(self):
+        self.visits = 0
+        self.counts = {}
+        self.totals = {}
+        self.children = {}
+
+    def choose(self,actions,exploration,rng):
+        """
+        @return: an untried action, if any, otherwise the action maximizing the UCB1 score
+        """
+        untried = [action for action in actions if action not in self.counts]
+        if untried:
+            return rng.choice(untried)
+        log = math.log(self.visits)
+        scores = [(self.totals[action]/self.counts[action]+exploration*math.sqrt(log/self.counts[action]),action)
+                  for action in actions]
+        best = max([score for score,action in scores])
+        return rng.choice([action for score,action in scores if score == best])
+
+    def update(self,action,value):
+        self.visits += 1
+        try:
+            self.counts[action] += 1
+            self.totals[action] += value
+        except KeyError:
+            self.counts[action] = 1
+            self.totals[action] = value
+
+class Search:
+    """
+    A single UCT search for an agent's decision, using L{World.stepFromState<psychsim.world.World.stepFromState>} as the generative model
+    @note: other agents are simulated by sampling from their quantal response (under their own rationality) to a one-step lookahead
+    @ivar lo: the lowest return seen so far
+    @type lo: float
+    @ivar hi: the highest return seen so far
+    @type hi: float
+    """
+    def __init__(self,agent,model,horizon,others=None,keys=None,exploration=1.):
+        """
+        @param agent: the agent making the decision
+        @type agent: L{Agent<psychsim.agent.Agent>}
+        @param model: the model of the agent making the decision
+        @param horizon: the number of steps to look ahead
+        @type horizon: int
+        @param others: the actions of any other agents in the current step
+        @param keys: subset of state features to project over (default is all state features)
+        @param exploration: the weight of the exploration term in UCB1, relative to the range of returns seen so far (default is 1)
+        @type exploration: float
+        """
+        self.agent = agent
+        self.world = agent.world
+        self.model = model
+        self.horizon = horizon
+        self.others = others
+        self.keys = keys
+        self.exploration = exploration
+        self.discount = agent.getAttribute('discount',model)
+        self.root = Node()
+        self.lo = None
+        self.hi = None
+
+    def run(self,belief,actions,iterations=None,budget=None):
+        """
+        Runs simulations from the given beliefs until the given budget runs out
+        @param belief: the distribution over the current state
+        @type belief: L{VectorDistribution<psychsim.pwl.vector.VectorDistribution>}
+        @param actions: the possible action choices in the current state
+        @param iterations: the maximum number of simulations to run
+        @type iterations: int
+        @param budget: the maximum number of seconds to run simulations for
+        @type budget: float
+        @return: the estimated value of each action choice
+        @rtype: L{ActionSet<psychsim.action.ActionSet>}S{->}float
+        """
+        actions = sorted(actions)
+        if iterations is None and budget is None:
+            iterations = 1000
+        if budget is not None:
+            deadline = time.time()+budget
+        count = 0
+        while count < len(actions) or \
+                ((iterations is None or count < iterations) and (budget is None or time.time() < deadline)):
+            action = self.root.choose(actions,self.getExploration(),self.agent.rng)
+            vector = belief.sample(rng=self.agent.rng)
+            value = self.simulate(vector,self.horizon,self.root.children,action,self.others)
+            self.root.update(action,value)
+            count += 1
+        return {action: self.root.totals[action]/self.root.counts[action] for action in actions}
+
+    def getExploration(self):
+        if self.lo is None or self.hi - self.lo < 1e-8:
+            return self.exploration
+        else:
+            return self.exploration*(self.hi-self.lo)
+
+    def simulate(self,vector,horizon,children,action=None,others=None,expand=True):
+        """
+        Samples a single trajectory from the given state
+        @param children: the nodes already in the search tree for the possible next states
+        @type children: dict
+        @param action: my action in the given state (default is to choose one if it is my turn)
+        @param expand: if C{True}, then add the next state to the search tree; otherwise, just roll out with random action choices (default is C{True})
+        @return: the (discounted) return of the trajectory, as in L{Agent.value<psychsim.agent.Agent.value>}
+        @rtype: float
+        """
+        R = self.agent.reward(vector,self.model)
+        if horizon == 0 or self.world.terminated(vector):
+            return self.record(R)
+        turn = {}
+        if others:
+            turn.update(others)
+        node = None
+        if action is None and self.agent.name in self.world.next(vector):
+            actions = sorted(self.agent.getActions(vector))
+            if len(actions) == 1:
+                action = actions[0]
+            elif expand:
+                key = (vector,horizon)
+                try:
+                    node = children[key]
+                except KeyError:
+                    # New leaf of the search tree, from which to roll out
+                    node = children[key] = Node()
+                    expand = False
+                action = node.choose(actions,self.getExploration(),self.agent.rng)
+            else:
+                action = self.agent.rng.choice(actions)
+        if action is not None:
+            turn[self.agent.name] = action
+        outcome = self.world.stepFromState(vector,turn,1,keys=self.keys,sample=True,explanation='action')
+        if 'new' not in outcome:
+            # No consistent outcome
+            return self.record(R)
+        new = outcome['new']
+        if isinstance(new,Distribution):
+            new = new.sample(rng=self.agent.rng)
+        if node is None:
+            future = self.simulate(new,horizon-1,children,expand=expand)
+        else:
+            future = self.simulate(new,horizon-1,node.children,expand=expand)
+        if self.discount < -1e-6:
+            # Only final value matters
+            value = future
+        else:
+            value = R+self.discount*future
+        if node is not None:
+            node.update(action,value)
+        return self.record(value)
+
+    def record(self,value):
+        if self.lo is None:
+            self.lo = self.hi = value
+        elif value < self.lo:
+            self.lo = value
+        elif value > self.hi:
+            self.hi = value
+        return value
+
+def search(agent,belief,actions,horizon,others=None,model=None,keys=None,
+           iterations=None,budget=None,exploration=1.):
+    """
+    Estimates the value of each of an agent's action choices by UCT
+    @param iterations: the maximum number of simulations to run (default is 1000, unless a time budget is given)
+    @type iterations: int
+    @param budget: the maximum number of seconds to run simulations for (default is no time limit)
+    @type budget: float
+    @note: each action is simulated at least once, regardless of the budget
+    @return: the estimated value of each action choice
+    @rtype: L{ActionSet<psychsim.action.ActionSet>}S{->}float
+    """
+    return Search(agent,model,horizon,others,keys,exploration).run(belief,actions,iterations,budget)
@@ -0,0 +1,102 @@
+"""
+Evaluation of an agent's action choices across a pool of worker processes or threads (see L{World.setExecutor<psychsim.world.World.setExecutor>})
+"""
+import multiprocessing
+import multiprocessing.pool
+import threading
+
+# Per-worker copy of the world (in the attribute world), along with the total number of agent models in that copy when it was made (in the attribute models)
+_local = threading.local()
+
+def countModels(world):
+    return sum([len(agent.models) for agent in world.agents.values()])
+
+def _initialize(world,threads=False):
+    if threads:
+        # Threads share memory, so each needs its own fork of the world
+        world = world.fork()
+    _local.world = world
+    _local.models = countModels(world)
+    # No nested pools within the workers
+    world.executor = None
+
+def _value(task):
+    """
+    Computes a single value in a worker process
+    @return: the result of L{Agent.value<psychsim.agent.Agent.value>}, and the values it added to the lookahead cache
+    @rtype: dict,list
+    """
+    name,state,action,horizon,others,model,keys,explanation,deadline = task
+    agent = _local.world.agents[name]
+    _local.world.deadline = deadline
+    cache = agent.getLookahead(model)
+    old = set(cache.table.keys())
+    result = agent.value(state,action,horizon,others,model,keys,explanation)
+    if countModels(_local.world) == _local.models:
+        entries = [(index,V) for index,V in cache.table.items() if index not in old]
+    else:
+        # Any models created during the lookahead exist only in this worker, so its cached values may not apply elsewhere
+        entries = []
+    return result,entries
+
+class Executor:
+    """
+    A pool of workers, each with its own copy of the world, for computing the values of an agent's action choices in parallel
+    @ivar world: the world whose agents' values are computed
+    @type world: L{World<psychsim.world.World>}
+    @ivar processes: the number of workers (C{None} for the number of CPUs)
+    @type processes: int
+    @ivar threads: if C{True}, then the workers are threads of this process, each with a L{World.fork<psychsim.world.World.fork>} of the world; otherwise, they are forked processes
+    @type threads: bool
+    @ivar pool: the current pool of workers, if any
+    @type pool: C{multiprocessing.pool.Pool}
+    @ivar revision: the L{World.revision<psychsim.world.World.revision>} of the world when the current workers copied it
+    @type revision: int
+    @note: the workers copy the world only when first needed, so they see the world as it is at the time of that evaluation; they are discarded after every real step of the world, and whenever the world has changed since they copied it (see L{refresh})
+    """
+    def __init__(self,world,processes=None,threads=False):
+        self.world = world
+        self.processes = processes
+        self.threads = threads
+        self.pool = None
+        self.revision = None
+
+    def evaluate(self,agent,tasks,horizon,others=None,model=None,explanation=None):
+        """
+        Computes the value of each of the given action choices in each of the given possible worlds, as in L{Agent.value<psychsim.agent.Agent.value>}
+        @param tasks: the possible world, action, and subset of state features to project over (C{None} for all) for each value to compute
+        @type tasks: (L{KeyedVector<psychsim.pwl.vector.KeyedVector>},L{ActionSet<psychsim.action.ActionSet>},set)[]
+        @return: the result of each value computation, in the same order as the tasks
+        @rtype: dict[]
+        @note: the values cached by the workers along the way are added to the agent's lookahead cache (see L{Agent.getLookahead<psychsim.agent.Agent.getLookahead>})
+        """
+        if self.pool is not None and self.revision != self.world.revision:
+            # The state, beliefs, or models have changed since the workers copied the world
+            self.refresh()
+        if self.pool is None:
+            self.revision = self.world.revision
+            if self.threads:
+                self.pool = multiprocessing.pool.ThreadPool(self.processes,_initialize,(self.world,True))
+            else:
+                context = multiprocessing.get_context('fork')
+                self.pool = context.Pool(self.processes,_initialize,(self.world,))
+        results = self.pool.map(_value,[(agent.name,state,action,horizon,others,model,keys,explanation,self.world.deadline)
+                                        for state,action,keys in tasks])
+        cache = agent.getLookahead(model)
+        if cache.size != 0:
+            for result,entries in results:
+                for index,V in entries:
+                    cache[index] = V
+        return [result for result,entries in results]
+
+    def refresh(self):
+        """
+        Discards the current workers, whose copies of the world are out of date, so that the next evaluation forks new ones
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def close(self):
+        self.refresh()
@@ -1,6 +1,12 @@
 import math
+import random
 from xml.dom.minidom import Document,Node
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class Distribution(dict):
     """
     A probability distribution
@@ -10,7 +16,7 @@ class Distribution(dict):
        - C{dist[value]}:     Returns the probability of the given value
        - C{dist[value] = x}: Sets the probability of the given value to x
 
-    The possible domain values are any objects
+    The possible domain values are any objects. Elements whose class sets C{structural} to C{True} (i.e., they provide a cheap, cached structural C{__hash__} and C{__eq__}) are stored under themselves; any other elements are stored under their C{str} representation.
     @warning: If you make the domain values mutable types, try not to change the values while they are inside the distribution.  If you must change a domain value, it is better to first delete the old value, change it, and then re-insert it.
     """
     epsilon = 1e-8
@@ -23,6 +29,7 @@ class Distribution(dict):
         @type rationality: float
         """
         self._domain = {}
+        self._sampler = None
         dict.__init__(self)
         if not args is None:
             if isinstance(args,Node):
@@ -42,8 +49,17 @@ class Distribution(dict):
                     self[key] = math.exp(rationality*V)
                 self.normalize()
 
+    def element2key(self,element):
+        """
+        @return: the key under which the given element is stored in this distribution
+        """
+        if getattr(element,'structural',False):
+            return element
+        else:
+            return str(element)
+
     def __getitem__(self,element):
-        key = str(element)
+        key = self.element2key(element)
         return dict.__getitem__(self,key)
         
     def __setitem__(self,element,value):
@@ -52,10 +68,15 @@ class Distribution(dict):
         @param value: the probability to associate with the given key
         @type value: float
         """
-        key = str(element)
+        key = self.element2key(element)
         self._domain[key] = element
+        self._sampler = None
         dict.__setitem__(self,key,value)
 
+    def __reduce__(self):
+        # Restore by element, rather than by key (which may be only the element's string)
+        return (self.__class__,(),None,None,iter([(element,self[element]) for element in self.domain()]))
+
     def addProb(self,element,value):
         """
         Utility method that increases the probability of the given element by the given value
@@ -75,13 +96,15 @@ class Distribution(dict):
             return 0.
 
     def __delitem__(self,element):
-        key = str(element)
+        key = self.element2key(element)
         dict.__delitem__(self,key)
         del self._domain[key]
+        self._sampler = None
 
     def clear(self):
         dict.clear(self)
         self._domain.clear()
+        self._sampler = None
 
     def replace(self,old,new):
         """Replaces on element in the sample space with another.  Raises an exception if the original element does not exist, and an exception if the new element already exists (i.e., does not do a merge)
@@ -129,21 +152,33 @@ class Distribution(dict):
                     total += element*self[element]
             return total
 
-    def sample(self,quantify=False):
+    def sampler(self):
+        """
+        @return: an alias table for drawing repeated samples from this distribution, built on first use and discarded whenever the distribution changes
+        @rtype: L{AliasSampler}
+        """
+        if self._sampler is None:
+            elements = self.domain()
+            self._sampler = AliasSampler(elements,[self[element] for element in elements])
+        return self._sampler
+
+    def sample(self,quantify=False,rng=None):
         """
         @param quantify: if C{True}, also returns the amount of mass by which the sampling crosssed the threshold of the generated sample's range
+        @param rng: the source of random numbers, e.g., L{World.rng} (default is the C{random} module)
+        @type rng: C{random.Random}
         @return: an element from this domain, with a sample probability given by this distribution
         """
-        import random
-        selection = random.random()
+        if rng is None:
+            rng = random
+        if not quantify:
+            return self.sampler().draw(rng)
+        selection = rng.random()
         for element in self.domain():
             if selection > self[element]:
                 selection -= self[element]
             else:
-                if quantify:
-                    return element,selection
-                else:
-                    return element
+                return element,selection
         else:
             raise ValueError('Random number exceeded total probability in distribution.')
 
@@ -155,16 +190,51 @@ class Distribution(dict):
         self.clear()
         self[element] = 1.
 
-    def select(self):
+    def select(self,rng=None):
         """
         Reduce distribution to a single element, sampled according to the given distribution
+        @param rng: the source of random numbers (default is the C{random} module)
+        @type rng: C{random.Random}
         @return: the probability of the selection made
         """
-        element = self.sample()
+        element = self.sample(rng=rng)
         prob = self[element]
         self.set(element)
         return prob
 
+    def resample(self,n,rng=None):
+        """
+        Reduce distribution to a fixed number of equally weighted samples, drawn by systematic resampling (i.e., a single random offset into n evenly spaced points)
+        @param n: the number of samples to draw
+        @type n: int
+        @param rng: the source of random numbers (default is the C{random} module)
+        @type rng: C{random.Random}
+        @note: duplicate samples are merged, so each remaining element has probability k/n, where k is the number of times it was drawn
+        """
+        elements = self.domain()
+        total = sum([self[element] for element in elements])
+        step = total/n
+        if rng is None:
+            rng = random
+        point = rng.random()*step
+        counts = []
+        cumulative = 0.
+        drawn = 0
+        for element in elements:
+            cumulative += self[element]
+            count = 0
+            while point < cumulative and drawn < n:
+                count += 1
+                drawn += 1
+                point += step
+            if count > 0:
+                counts.append([element,count])
+        # Any points lost to rounding error go to the last element
+        counts[-1][1] += n-drawn
+        self.clear()
+        for element,count in counts:
+            self[element] = float(count)/float(n)
+
     def max(self):
         """
         @return: the most probable element in this distribution (breaking ties by returning the highest-valued element)
@@ -215,7 +285,7 @@ class Distribution(dict):
             node = doc.createElement('entry')
             root.appendChild(node)
             node.setAttribute('probability',str(prob))
-            if key != str(value):
+            if isinstance(key,str) and key != str(value):
                 node.setAttribute('key',key)
             if isinstance(value,str):
                 node.setAttribute('key',key)
@@ -243,9 +313,10 @@ class Distribution(dict):
                     subNode = subNode.nextSibling
                 value = self.xml2element(key,subNode)
                 if not key:
-                    key = str(value)
+                    key = self.element2key(value)
                 dict.__setitem__(self,key,prob)
                 self._domain[key] = value
+                self._sampler = None
             node = node.nextSibling
 
     def xml2element(self,key,node):
@@ -264,3 +335,82 @@ class Distribution(dict):
 
     def __copy__(self):
         return self.__class__(self.__xml__().documentElement)
+
+class AliasSampler:
+    """
+    Walker's alias table (as constructed by Vose) over a fixed set of weighted elements. Construction is linear in the number of elements, after which each draw takes constant time.
+    @ivar elements: the possible samples
+    @type elements: list
+    @ivar threshold: for each column of the table, the probability of drawing its own element rather than its alias
+    @type threshold: float[]
+    @ivar alias: for each column of the table, the index of the element to draw otherwise
+    @type alias: int[]
+    """
+    def __init__(self,elements,probs):
+        """
+        @param elements: the possible samples
+        @type elements: list
+        @param probs: the (not necessarily normalized) probability of each element
+        @type probs: float[]
+        """
+        total = float(sum(probs))
+        if len(elements) == 0 or total <= 0.:
+            raise ValueError('Unable to sample from an empty distribution.')
+        self.elements = list(elements)
+        size = len(self.elements)
+        scaled = [prob*size/total for prob in probs]
+        self.threshold = [1.]*size
+        self.alias = list(range(size))
+        small = [index for index in range(size) if scaled[index] < 1.]
+        large = [index for index in range(size) if scaled[index] >= 1.]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.threshold[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.-scaled[less]
+            if scaled[more] < 1.:
+                small.append(more)
+            else:
+                large.append(more)
+        # Anything left over is 1 up to rounding error, so it keeps its default entries
+        self._arrays = None
+
+    def __len__(self):
+        return len(self.elements)
+
+    def draw(self,rng=random):
+        """
+        @param rng: the source of random numbers (default is the C{random} module)
+        @return: a single element, drawn with its given probability
+        """
+        spin = rng.random()*len(self.elements)
+        column = min(int(spin),len(self.elements)-1)
+        if spin-column < self.threshold[column]:
+            return self.elements[column]
+        else:
+            return self.elements[self.alias[column]]
+
+    def sample(self,n,rng=None):
+        """
+        @param n: the number of independent draws to make
+        @type n: int
+        @param rng: the source of random numbers, either a C{numpy} random generator (default is C{numpy.random}) or a C{random.Random}, from which a C{numpy} generator is seeded so that the draws come from the same stream
+        @return: the drawn elements, in order
+        @rtype: list
+        """
+        if numpy is None:
+            if rng is None:
+                rng = random
+            return [self.draw(rng) for index in range(n)]
+        if rng is None:
+            rng = numpy.random
+        elif hasattr(rng,'getrandbits'):
+            rng = numpy.random.default_rng(rng.getrandbits(64))
+        if self._arrays is None:
+            self._arrays = (numpy.array(self.threshold),numpy.array(self.alias,dtype=int))
+        threshold,alias = self._arrays
+        spins = rng.random(n)*len(self.elements)
+        columns = numpy.minimum(spins.astype(int),len(self.elements)-1)
+        indices = numpy.where(spins-columns < threshold[columns],columns,alias[columns])
+        return [self.elements[index] for index in indices]
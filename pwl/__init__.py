@@ -8,3 +8,4 @@ from .vector import *
 from .matrix import *
 from .plane import *
 from .tree import *
+from .compiled import *
@@ -0,0 +1,240 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from psychsim.probability import Distribution
+
+from .vector import KeyedVector,ArrayVector,FeatureIndex
+from .matrix import KeyedMatrix
+
+def vectors2matrix(vectors,index,missing=0.):
+    """
+    @param vectors: the state vectors to convert
+    @type vectors: L{KeyedVector}[] or L{VectorDistribution}
+    @param missing: the value to use for any absent keys (default is 0)
+    @return: the given state vectors as rows of a 2-D array over the given index (any keys not in the index are ignored)
+    """
+    if getattr(vectors,'index',None) is index:
+        # Already stored as rows
+        vectors._grow()
+        rows = vectors.rows[:vectors.size]
+        if missing == missing:
+            rows = numpy.where(numpy.isnan(rows),missing,rows)
+        return rows
+    if isinstance(vectors,Distribution):
+        vectors = vectors.domain()
+    rows = numpy.full((len(vectors),len(index)),missing)
+    for row,vector in enumerate(vectors):
+        if isinstance(vector,ArrayVector) and vector.index is index:
+            vector._grow()
+            rows[row] = numpy.where(vector.mask,vector.array,missing)
+        else:
+            for key,value in vector.items():
+                col = index.columns.get(key)
+                if col is not None:
+                    rows[row,col] = value
+    return rows
+
+class CompiledTree:
+    """
+    A L{KeyedTree} flattened into arrays over the columns of a L{FeatureIndex}, so that a whole batch of state vectors can be routed through it at once
+    @cvar LEAF: the comparison code for leaf nodes
+    @cvar PROBABILISTIC: the comparison code for probabilistic branches
+    @ivar index: the column assignment for the keys referenced by the tree
+    @type index: L{FeatureIndex}
+    @ivar weights: the hyperplane weights at each node (all zeros for leaves and probabilistic branches)
+    @ivar thresholds: the hyperplane threshold at each node
+    @ivar comparisons: the hyperplane comparison at each node (1, -1, 0 as in L{KeyedPlane}), or L{LEAF} or L{PROBABILISTIC}
+    @ivar trueChild: the node reached when the hyperplane test at each node succeeds
+    @ivar falseChild: the node reached when the hyperplane test at each node fails
+    @ivar leafIndex: the position in L{leaves} of the value at each leaf node
+    @ivar leaves: the values at the leaves of the tree
+    @type leaves: list
+    @ivar choices: the list of thresholds for any equality test against multiple values
+    @type choices: intS{->}float[]
+    @ivar distributions: the child nodes and their probabilities for each probabilistic branch
+    @type distributions: intS{->}(int[],float[])
+    """
+    LEAF = 2
+    PROBABILISTIC = 3
+
+    def __init__(self,tree,index=None):
+        """
+        @param tree: the tree to compile (must already be desymbolized)
+        @type tree: L{KeyedTree}
+        @param index: the column assignment to compile against (default is a new index over the keys in the tree)
+        @type index: L{FeatureIndex}
+        """
+        if numpy is None:
+            raise ImportError('%s requires numpy' % (self.__class__.__name__))
+        if index is None:
+            index = FeatureIndex()
+        self.index = index
+        self.leaves = []
+        self._rows = {}
+        self.choices = {}
+        self.distributions = {}
+        nodes = []
+        self._flatten(tree,nodes,{})
+        for node in nodes:
+            if node[0] == self.LEAF or node[0] == self.PROBABILISTIC:
+                continue
+            for key in node[1].vector.keys():
+                index.add(key)
+        size = len(nodes)
+        self.weights = numpy.zeros((size,len(index)))
+        self.thresholds = numpy.zeros(size)
+        self.comparisons = numpy.zeros(size,dtype=int)
+        self.trueChild = numpy.zeros(size,dtype=int)
+        self.falseChild = numpy.zeros(size,dtype=int)
+        self.leafIndex = numpy.full(size,-1,dtype=int)
+        for node,entry in enumerate(nodes):
+            self.comparisons[node] = entry[0]
+            if entry[0] == self.LEAF:
+                self.leafIndex[node] = entry[1]
+            elif entry[0] != self.PROBABILISTIC:
+                plane,trueNode,falseNode = entry[1:]
+                for key,value in plane.vector.items():
+                    self.weights[node,index.columns[key]] = value
+                if isinstance(plane.threshold,list):
+                    self.choices[node] = numpy.array(plane.threshold,dtype=float)
+                else:
+                    self.thresholds[node] = plane.threshold
+                self.trueChild[node] = trueNode
+                self.falseChild[node] = falseNode
+
+    def _flatten(self,tree,nodes,memo):
+        """
+        Appends the nodes of the given tree to the given list (visiting any shared subtrees only once)
+        @return: the position of the root of the given tree
+        @rtype: int
+        """
+        try:
+            return memo[id(tree)]
+        except KeyError:
+            pass
+        node = len(nodes)
+        memo[id(tree)] = node
+        nodes.append(None)
+        if tree.isLeaf():
+            nodes[node] = (self.LEAF,len(self.leaves))
+            self.leaves.append(tree.children[None])
+        elif tree.isProbabilistic():
+            nodes[node] = (self.PROBABILISTIC,)
+            children = []
+            probs = []
+            for child in tree.children.domain():
+                probs.append(tree.children[child])
+                children.append(self._flatten(child,nodes,memo))
+            self.distributions[node] = (numpy.array(children,dtype=int),numpy.array(probs))
+        else:
+            plane = tree.branch
+            if isinstance(plane.threshold,str) or plane.comparison not in (-1,0,1) or \
+                    [value for value in plane.vector.values() if isinstance(value,str)]:
+                raise ValueError('Unable to compile symbolic hyperplane: %s' % (plane))
+            trueNode = self._flatten(tree.children[True],nodes,memo)
+            falseNode = self._flatten(tree.children[False],nodes,memo)
+            nodes[node] = (plane.comparison,plane,trueNode,falseNode)
+        return node
+
+    def matrix(self,vectors):
+        """
+        @param vectors: the state vectors to evaluate
+        @type vectors: L{KeyedVector}[] or L{VectorDistribution}
+        @return: the given state vectors as rows of a 2-D array over my index (with 0 for any absent keys)
+        """
+        return vectors2matrix(vectors,self.index)
+
+    def evaluate(self,vectors):
+        """
+        Routes a batch of state vectors through the tree
+        @param vectors: the state vectors to evaluate, either as a 2-D array over my index, or as accepted by L{matrix}
+        @return: three parallel arrays, giving the position of the state vector, the position of the leaf reached in L{leaves}, and the probability of reaching that leaf from that state vector
+        @rtype: (int[],int[],float[])
+        """
+        if isinstance(vectors,numpy.ndarray):
+            rows = vectors
+        else:
+            rows = self.matrix(vectors)
+        if self.weights.shape[1] < rows.shape[1]:
+            # Index has grown since compilation (new columns cannot affect my hyperplanes)
+            rows = rows[:,:self.weights.shape[1]]
+        elif self.weights.shape[1] > rows.shape[1]:
+            rows = numpy.hstack((rows,numpy.zeros((len(rows),self.weights.shape[1]-rows.shape[1]))))
+        positions = numpy.arange(len(rows))
+        nodes = numpy.zeros(len(rows),dtype=int)
+        probs = numpy.ones(len(rows))
+        epsilon = KeyedVector.epsilon
+        while True:
+            codes = self.comparisons[nodes]
+            pending = codes != self.LEAF
+            if not pending.any():
+                break
+            stochastic = codes == self.PROBABILISTIC
+            if stochastic.any():
+                # Expand each probabilistic branch into all of its children
+                expanded = [(positions[~stochastic],nodes[~stochastic],probs[~stochastic])]
+                for node in numpy.unique(nodes[stochastic]):
+                    children,weights = self.distributions[node]
+                    mine = nodes == node
+                    count = mine.sum()
+                    expanded.append((numpy.repeat(positions[mine],len(children)),
+                                     numpy.tile(children,count),
+                                     numpy.repeat(probs[mine],len(children))*numpy.tile(weights,count)))
+                positions = numpy.concatenate([entry[0] for entry in expanded])
+                nodes = numpy.concatenate([entry[1] for entry in expanded])
+                probs = numpy.concatenate([entry[2] for entry in expanded])
+                continue
+            active = numpy.flatnonzero(pending)
+            where = nodes[active]
+            totals = numpy.einsum('ij,ij->i',self.weights[where],rows[positions[active]])
+            thresholds = self.thresholds[where]
+            codes = codes[active]
+            result = numpy.where(codes > 0,totals+epsilon > thresholds,
+                                 numpy.where(codes < 0,totals-epsilon < thresholds,
+                                             numpy.abs(totals-thresholds) < epsilon))
+            for node,values in self.choices.items():
+                # Equality against any of multiple values
+                mine = where == node
+                if mine.any():
+                    result[mine] = (numpy.abs(totals[mine,None]-values[None,:]) < epsilon).any(axis=1)
+            nodes[active] = numpy.where(result,self.trueChild[where],self.falseChild[where])
+        return positions,self.leafIndex[nodes],probs
+
+    def leafRows(self,key):
+        """
+        @return: the weights of the row for the given key within each leaf matrix (as a 2-D array over my index), the 0/1 pattern of nonzero entries in those weights, and a flag for each leaf indicating whether it is a numeric L{KeyedMatrix} with such a row
+        @rtype: (float[][],float[][],bool[])
+        """
+        try:
+            return self._rows[key]
+        except KeyError:
+            pass
+        linear = numpy.zeros(len(self.leaves),dtype=bool)
+        for position,leaf in enumerate(self.leaves):
+            if isinstance(leaf,KeyedMatrix) and key in leaf:
+                if not [value for value in leaf[key].values() if isinstance(value,str)]:
+                    linear[position] = True
+                    for col in leaf[key].keys():
+                        self.index.add(col)
+        weights = numpy.zeros((len(self.leaves),len(self.index)))
+        pattern = numpy.zeros((len(self.leaves),len(self.index)))
+        for position in numpy.flatnonzero(linear):
+            for col,value in self.leaves[position][key].items():
+                weights[position,self.index.columns[col]] = value
+                pattern[position,self.index.columns[col]] = 1.
+        self._rows[key] = (weights,pattern,linear)
+        return self._rows[key]
+
+    def __getitem__(self,vector):
+        """
+        @return: the leaf value reached by a single state vector, or a L{Distribution} over them if more than one is reachable
+        """
+        positions,leaves,probs = self.evaluate([vector])
+        if len(leaves) == 1 and probs[0] == 1.:
+            return self.leaves[leaves[0]]
+        result = Distribution()
+        for leaf,prob in zip(leaves,probs):
+            result.addProb(self.leaves[leaf],float(prob))
+        return result
@@ -1,15 +1,24 @@
 import copy
 from xml.dom.minidom import Document,Node
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from psychsim.probability import Distribution
 
 from .vector import *
 from . import CONSTANT
 
 class KeyedMatrix(dict):
+    structural = True
+
     def __init__(self,arg={}):
         self._keysIn = None
         self._keysOut = None
+        self._dense = None
+        self._hash = None
         if isinstance(arg,Node):
             dict.__init__(self)
             self.parse(arg)
@@ -18,16 +27,7 @@ class KeyedMatrix(dict):
             self._string = None
         
     def __eq__(self,other):
-        return str(self) == str(other)
-         # for key,vector in self.items():
-         #     try:
-         #         if vector != other[key]:
-         #             return False
-         #     except KeyError:
-         #         if vector != {}:
-         #             return False
-         # else:
-         #     return True
+        return isinstance(other,KeyedMatrix) and dict.__eq__(self,other)
 
     def __ne__(self,other):
         return not self == other
@@ -65,6 +65,13 @@ class KeyedMatrix(dict):
                                 result[r1][c2] += value1*value2
                             except KeyError:
                                 result[r1][c2] = value1*value2
+        elif isinstance(other,ArrayVector) and all(row in other.index for row in self):
+            columns,weights,pattern = self.dense(other.index)
+            other._grow()
+            present = pattern.dot(other.mask) > 0
+            result = ArrayVector(index=other.index)
+            result.array[columns[present]] = weights.dot(other.array)[present]
+            result.mask[columns[present]] = True
         elif isinstance(other,KeyedVector):
             result = KeyedVector()
             for r1,v1 in list(self.items()):
@@ -121,6 +128,29 @@ class KeyedMatrix(dict):
             self.getKeysIn()
         return self._keysOut
 
+    def dense(self,index):
+        """
+        @return: the columns of my rows, my weights as a 2-D array, and the 0/1 pattern of nonzero entries, all with respect to the given index
+        @type index: L{FeatureIndex}
+        @raise KeyError: if any of my rows has no column in the given index (which is left unchanged)
+        """
+        if self._dense is None or self._dense[0] is not index or self._dense[1] != len(index):
+            rows = list(self.keys())
+            columns = numpy.array([index.columns[row] for row in rows],dtype=int)
+            weights = numpy.zeros((len(rows),len(index)))
+            pattern = numpy.zeros((len(rows),len(index)))
+            for i,row in enumerate(rows):
+                for col,value in self[row].items():
+                    try:
+                        j = index.columns[col]
+                    except KeyError:
+                        # This column cannot appear in any vector using this index
+                        continue
+                    weights[i,j] = value
+                    pattern[i,j] = 1.
+            self._dense = (index,len(index),columns,weights,pattern)
+        return self._dense[2:]
+
     # def getKeys(self):
     #     result = set()
     #     for row in self.values():
@@ -164,10 +194,14 @@ class KeyedMatrix(dict):
         assert isinstance(value,KeyedVector),'Illegal row type: %s' % \
             (value.__class__.__name__)
         self._string = None
+        self._dense = None
+        self._hash = None
         dict.__setitem__(self,key,value)
 
     def update(self,other):
         self._string = None
+        self._dense = None
+        self._hash = None
         dict.update(self,other)
     
     def __str__(self):
@@ -179,7 +213,9 @@ class KeyedMatrix(dict):
         return self._string
 
     def __hash__(self):
-        return hash(str(self))
+        if self._hash is None:
+            self._hash = hash(frozenset(self.items()))
+        return self._hash
 
     def __xml__(self):
         doc = Document()
@@ -193,6 +229,8 @@ class KeyedMatrix(dict):
 
     def parse(self,element):
         self._string = None
+        self._dense = None
+        self._hash = None
         assert element.tagName == 'matrix'
         node = element.firstChild
         while node:
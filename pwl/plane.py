@@ -1,7 +1,7 @@
 import operator
 from xml.dom.minidom import Node
 
-from .vector import KeyedVector
+from .vector import KeyedVector,quantize
 from functools import reduce
 
 class KeyedPlane:
@@ -17,6 +17,7 @@ class KeyedPlane:
 
     def __init__(self,vector,threshold=None,comparison=1):
         self._string = None
+        self._hash = None
         if isinstance(vector,Node):
             self.parse(vector)
         else:
@@ -84,6 +85,15 @@ class KeyedPlane:
         else:
             return False
 
+    def __hash__(self):
+        if self._hash is None:
+            if isinstance(self.threshold,list):
+                threshold = tuple([quantize(t,self.vector.epsilon) for t in self.threshold])
+            else:
+                threshold = quantize(self.threshold,self.vector.epsilon)
+            self._hash = hash((self.vector,threshold,self.comparison))
+        return self._hash
+
     def compare(self,other,value):
         """
         Identifies any potential conflicts between two hyperplanes
@@ -3,9 +3,10 @@ from xml.dom.minidom import Document,Node
 from psychsim.probability import Distribution
 from psychsim.action import Action
 
-from .vector import KeyedVector
+from .vector import KeyedVector,quantize
 from .matrix import *
 from .plane import KeyedPlane
+from .compiled import CompiledTree
 
 class KeyedTree:
     """
@@ -17,8 +18,11 @@ class KeyedTree:
     @ivar branch: the hyperplane branch at this node (if applicable)
     @type branch: L{KeyedPlane}
     """
+    structural = True
+
     def __init__(self,leaf=None):
         self._string = None
+        self._hash = None
         self._keysIn = None
         self._keysOut = None
         if isinstance(leaf,Node):
@@ -33,17 +37,23 @@ class KeyedTree:
         self.children = {None: leaf}
         self.leaf = True
         self.branch = None
+        self._string = None
+        self._hash = None
 
     def makeBranch(self,plane,trueTree,falseTree):
         self.children = {True: trueTree,False: falseTree}
         self.branch = plane
         self.leaf = False
+        self._string = None
+        self._hash = None
 
     def makeProbabilistic(self,distribution):
         assert isinstance(distribution,Distribution)
         self.children = distribution
         self.branch = None
         self.leaf = False
+        self._string = None
+        self._hash = None
 
     def isProbabilistic(self):
         """
@@ -107,6 +117,19 @@ class KeyedTree:
     #             result |= child.getKeys()
     #     return result
 
+    def leaves(self):
+        """
+        @return: all of the leaf values reachable in this tree, along any branch
+        @rtype: list
+        """
+        if self.isLeaf():
+            return [self.children[None]]
+        elif self.isProbabilistic():
+            children = self.children.domain()
+        else:
+            children = list(self.children.values())
+        return sum([child.leaves() for child in children],[])
+
     def collapseProbabilistic(self):
         """
         Utility method that combines any consecutive probabilistic branches at this node into a single distribution
@@ -154,6 +177,28 @@ class KeyedTree:
             # Deterministic branch
             return self.children[self.branch.evaluate(index)][index]
 
+    def sample(self,index,rng=None):
+        """
+        @param rng: the source of random numbers (default is the C{random} module)
+        @type rng: C{random.Random}
+        @return: the single leaf value reached by the given vector, choosing a child at random at any probabilistic branch (rather than returning a L{Distribution} as in C{tree[index]})
+        """
+        if self.isLeaf():
+            return self.children[None]
+        elif self.branch is None:
+            return self.children.sample(rng=rng).sample(index,rng)
+        else:
+            return self.children[self.branch.evaluate(index)].sample(index,rng)
+
+    def compile(self,index=None):
+        """
+        @param index: the column assignment to compile against (default is a new index over the keys in this tree)
+        @type index: L{FeatureIndex}
+        @return: an equivalent tree flattened into arrays, for evaluating batches of state vectors
+        @rtype: L{CompiledTree}
+        """
+        return CompiledTree(self,index)
+
     def desymbolize(self,table,debug=False):
         """
         @return: a new tree with any symbolic references replaced with numeric values according to the table of element lists
@@ -237,7 +282,11 @@ class KeyedTree:
         return tree
 
     def __eq__(self,other):
-        if self.isLeaf():
+        if not isinstance(other,KeyedTree):
+            return False
+        elif self is other:
+            return True
+        elif self.isLeaf():
             if other.isLeaf():
                 return self.children[None] == other.children[None]
             else:
@@ -246,7 +295,7 @@ class KeyedTree:
             if isinstance(other.children,Distribution):
                 return self.children == other.children
             else:
-                return false
+                return False
         else:
             if self.branch == other.branch:
                 return self.children == other.children
@@ -473,7 +522,18 @@ class KeyedTree:
             self.children[False].minimizePlanes()
             
     def __hash__(self):
-        return hash(str(self))
+        if self._hash is None:
+            if self.isLeaf():
+                try:
+                    self._hash = hash(quantize(self.children[None],KeyedVector.epsilon))
+                except TypeError:
+                    # Unhashable leaf
+                    self._hash = hash(str(self.children[None]))
+            elif self.isProbabilistic():
+                self._hash = hash(frozenset([(child,quantize(self.children[child],Distribution.epsilon)) for child in self.children.domain()]))
+            else:
+                self._hash = hash((self.branch,self.children[True],self.children[False]))
+        return self._hash
 
     def __str__(self):
         if self._string is None:
@@ -1,6 +1,28 @@
 from xml.dom.minidom import Document,Node
 
-from psychsim.probability import Distribution
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from psychsim.probability import Distribution,AliasSampler
+
+HASH_MODULUS = (1 << 61) - 1
+
+def quantize(value,epsilon=1e-8):
+    """
+    @return: the given value as a count of C{epsilon} steps, so that numbers that differ only by rounding error hash alike (non-numeric values are returned unchanged)
+    """
+    try:
+        return round(value/epsilon)
+    except (TypeError,ValueError,OverflowError):
+        return value
+
+def itemHash(key,value):
+    """
+    @return: the hash of a single vector entry, consistent with the tolerance used by L{KeyedVector.__eq__}
+    """
+    return hash((key,quantize(value,KeyedVector.epsilon)))
 
 class KeyedVector(dict):
     """
@@ -9,8 +31,12 @@ class KeyedVector(dict):
     @type epsilon: float
     @ivar _string: the C{str} representation of this vector
     @type _string: bool
+    @ivar _hash: the cached hash of the contents of this vector
+    @type _hash: int
     """
     epsilon = 1e-8
+    structural = True
+    __slots__ = ('_string','_hash','_columns')
 
     def __init__(self,arg={}):
         if isinstance(arg,Node):
@@ -19,6 +45,8 @@ class KeyedVector(dict):
         else:
             dict.__init__(self,arg)
         self._string = None
+        self._hash = None
+        self._columns = None
 
     def __eq__(self,other):
         delta = 0.
@@ -56,7 +84,10 @@ class KeyedVector(dict):
         return self + (-other)
 
     def __mul__(self,other):
-        if isinstance(other,KeyedVector):
+        if isinstance(other,ArrayVector):
+            # Let the array do the work
+            return other*self
+        elif isinstance(other,KeyedVector):
             # Dot product
             total = 0.
             for key,value in list(self.items()):
@@ -74,12 +105,57 @@ class KeyedVector(dict):
 
     def __setitem__(self,key,value):
         self._string = None
+        self._hash = None
+        self._columns = None
         dict.__setitem__(self,key,value)
 
     def __delitem__(self,key):
         self._string = None
+        self._hash = None
+        self._columns = None
         dict.__delitem__(self,key)
 
+    def update(self,other):
+        self._string = None
+        self._hash = None
+        self._columns = None
+        dict.update(self,other)
+
+    def alter(self,delta):
+        """
+        @param delta: the new values for any keys to be changed
+        @type delta: dict
+        @return: a copy of me with the given changes applied (I am left unchanged)
+        @rtype: L{KeyedVector}
+        """
+        result = self.__class__(self)
+        result.update(delta)
+        return result
+
+    def freeze(self):
+        """
+        @return: an immutable copy of me
+        @rtype: L{FrozenKeyedVector}
+        """
+        return FrozenKeyedVector(self)
+
+    def project(self,index):
+        """
+        @return: the columns (within the given index) and weights of my entries, skipping any keys not in the index
+        @rtype: (int[],float[])
+        """
+        if self._columns is None or self._columns[0] is not index or self._columns[1] != len(index):
+            columns = []
+            weights = []
+            for key,value in self.items():
+                try:
+                    columns.append(index.columns[key])
+                except KeyError:
+                    continue
+                weights.append(value)
+            self._columns = (index,len(index),numpy.array(columns,dtype=int),numpy.array(weights,dtype=float))
+        return self._columns[2],self._columns[3]
+
     def desymbolize(self,table,debug=False):
         result = self.__class__()
         for key,value in list(self.items()):
@@ -142,7 +218,13 @@ class KeyedVector(dict):
         return '%s(%r)' % (self.__class__.__name__,dict(self))
 
     def __hash__(self):
-        return hash(str(self))
+        if self._hash is None:
+            # Sum of item hashes, so that L{DeltaVector} can update it one key at a time
+            self._hash = sum([itemHash(key,value) for key,value in self.items()]) % HASH_MODULUS
+        return self._hash
+
+    def __reduce__(self):
+        return (self.__class__,(dict(self),))
 
     def __xml__(self):
         doc = Document()
@@ -157,6 +239,8 @@ class KeyedVector(dict):
 
     def parse(self,element):
         self._string = None
+        self._hash = None
+        self._columns = None
         node = element.firstChild
         while node:
             if node.nodeType == node.ELEMENT_NODE:
@@ -169,6 +253,373 @@ class KeyedVector(dict):
                 dict.__setitem__(self,key,value)
             node = node.nextSibling
 
+class FrozenKeyedVector(KeyedVector):
+    """
+    An immutable L{KeyedVector}, suitable for use as a state key in distributions and caches.
+    Its hash is computed once, at creation, and changes are made by creating new vectors via L{alter}.
+    """
+    __slots__ = ()
+
+    def __init__(self,arg={}):
+        if isinstance(arg,Node):
+            arg = KeyedVector(arg)
+        KeyedVector.__init__(self,arg)
+        KeyedVector.__hash__(self)
+
+    def __eq__(self,other):
+        if self is other:
+            return True
+        elif isinstance(other,FrozenKeyedVector) and self._hash == other._hash and dict.__eq__(self,other):
+            return True
+        else:
+            return KeyedVector.__eq__(self,other)
+
+    def __ne__(self,other):
+        return not self == other
+
+    __hash__ = KeyedVector.__hash__
+
+    def _immutable(self,*args,**kwargs):
+        raise TypeError('%s does not support modification' % (self.__class__.__name__))
+
+    __setitem__ = __delitem__ = update = clear = pop = popitem = setdefault = parse = __ior__ = _immutable
+
+    def alter(self,delta):
+        return DeltaVector(self,delta)
+
+    def freeze(self):
+        return self
+
+    def filter(self,ignore):
+        return KeyedVector(self).filter(ignore).freeze()
+
+    def desymbolize(self,table,debug=False):
+        return KeyedVector(self).desymbolize(table,debug).freeze()
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self,memo):
+        return self
+
+class DeltaVector(FrozenKeyedVector):
+    """
+    A L{FrozenKeyedVector} that records only the keys changed relative to a base vector, which it shares rather than copies.
+    The changed keys are my own table of values, and lookups consult them and then the base; the full table is built only when the vector is enumerated (e.g., via L{keys}, L{items}, or L{copy}).
+    The hash is derived from the base's hash in time proportional to the number of changes.
+    """
+    __slots__ = ('_base',)
+
+    def __init__(self,arg={},delta=None):
+        """
+        @param arg: the base vector (if C{delta} is given), otherwise the complete contents
+        @param delta: the new values for any changed keys (default is C{None})
+        @type delta: dict
+        """
+        if delta is None:
+            self._base = None
+            FrozenKeyedVector.__init__(self,arg)
+            return
+        dict.__init__(self)
+        self._string = None
+        self._columns = None
+        base = arg.freeze()
+        if isinstance(base,DeltaVector) and base._base is not None:
+            # Stack on the original base, rather than on another overlay
+            changes = dict(dict.items(base))
+            changes.update(delta)
+            base = base._base
+        else:
+            changes = dict(delta)
+        total = hash(base)
+        for key,value in changes.items():
+            if key in base:
+                total -= itemHash(key,base[key])
+            total += itemHash(key,value)
+        self._hash = total % HASH_MODULUS
+        if changes:
+            self._base = base
+            dict.update(self,changes)
+        else:
+            # An empty table would hide the base from code that reads it directly
+            self._base = None
+            dict.update(self,base)
+
+    def materialize(self):
+        """
+        Fills in my table of values from the base and changes (leaving my hash as is)
+        """
+        if self._base is not None:
+            changes = dict(dict.items(self))
+            dict.update(self,self._base)
+            dict.update(self,changes)
+            self._base = None
+
+    def __getitem__(self,key):
+        try:
+            return dict.__getitem__(self,key)
+        except KeyError:
+            if self._base is None:
+                raise
+            return self._base[key]
+
+    def get(self,key,default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self,key):
+        return dict.__contains__(self,key) or (self._base is not None and key in self._base)
+
+    def __len__(self):
+        if self._base is None:
+            return dict.__len__(self)
+        else:
+            return len(self._base)+len([key for key in dict.keys(self) if key not in self._base])
+
+    def __iter__(self):
+        self.materialize()
+        return dict.__iter__(self)
+
+    def keys(self):
+        self.materialize()
+        return dict.keys(self)
+
+    def values(self):
+        self.materialize()
+        return dict.values(self)
+
+    def items(self):
+        self.materialize()
+        return dict.items(self)
+
+    def copy(self):
+        self.materialize()
+        return dict.copy(self)
+
+    def __or__(self,other):
+        self.materialize()
+        return dict.__or__(self,other)
+
+    def __eq__(self,other):
+        if self is other:
+            return True
+        elif isinstance(other,DeltaVector) and self._base is not None and self._base is other._base:
+            # Only the changed keys can differ
+            delta = 0.
+            for key in set(dict.keys(self)) | set(dict.keys(other)):
+                delta += abs(self.get(key,0.)-other.get(key,0.))
+            return delta < self.epsilon
+        self.materialize()
+        if isinstance(other,DeltaVector):
+            other.materialize()
+        return FrozenKeyedVector.__eq__(self,other)
+
+    def __ne__(self,other):
+        return not self == other
+
+    __hash__ = KeyedVector.__hash__
+
+    def __reduce__(self):
+        return (FrozenKeyedVector,(dict(self.items()),))
+
+class FeatureIndex:
+    """
+    Assignment of state feature keys to columns, shared by all of the L{ArrayVector} instances within a world
+    @ivar keys: the keys in column order
+    @type keys: str[]
+    @ivar columns: the column of each key
+    @type columns: strS{->}int
+    """
+    def __init__(self,keys=[]):
+        if numpy is None:
+            raise ImportError('%s requires numpy' % (self.__class__.__name__))
+        self.keys = []
+        self.columns = {}
+        for key in keys:
+            self.add(key)
+
+    def add(self,key):
+        """
+        Registers the given key (if not already registered)
+        @return: the column for the given key
+        @rtype: int
+        """
+        try:
+            return self.columns[key]
+        except KeyError:
+            self.columns[key] = len(self.keys)
+            self.keys.append(key)
+            return self.columns[key]
+
+    def __contains__(self,key):
+        return key in self.columns
+
+    def __len__(self):
+        return len(self.keys)
+
+class ArrayVector(KeyedVector):
+    """
+    A L{KeyedVector} whose values are stored in a contiguous float array, with columns assigned by a L{FeatureIndex}.
+    Dot products with other vectors and products with L{KeyedMatrix} instances are computed as single array operations.
+    @ivar index: the column assignment for my keys
+    @type index: L{FeatureIndex}
+    @ivar array: the value in each column (0 for absent keys)
+    @ivar mask: flag for each column indicating whether the key is present
+    """
+    def __init__(self,arg={},index=None):
+        dict.__init__(self)
+        self._string = None
+        self._hash = None
+        self._columns = None
+        if index is None:
+            if isinstance(arg,ArrayVector):
+                index = arg.index
+            else:
+                index = FeatureIndex()
+        self.index = index
+        if isinstance(arg,ArrayVector) and arg.index is index:
+            self.array = arg.array.copy()
+            self.mask = arg.mask.copy()
+        else:
+            self.array = numpy.zeros(len(index))
+            self.mask = numpy.zeros(len(index),dtype=bool)
+            if isinstance(arg,Node):
+                arg = KeyedVector(arg)
+            for key,value in arg.items():
+                self[key] = value
+
+    def _grow(self):
+        """
+        Extends my arrays to cover any columns added to the index since I was created
+        """
+        extra = len(self.index) - len(self.array)
+        if extra > 0:
+            self.array = numpy.concatenate((self.array,numpy.zeros(extra)))
+            self.mask = numpy.concatenate((self.mask,numpy.zeros(extra,dtype=bool)))
+
+    def __getitem__(self,key):
+        col = self.index.columns.get(key)
+        if col is None or col >= len(self.mask) or not self.mask[col]:
+            raise KeyError(key)
+        return float(self.array[col])
+
+    def get(self,key,default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self,key,value):
+        self._string = None
+        self._hash = None
+        self._columns = None
+        col = self.index.add(key)
+        if col >= len(self.array):
+            self._grow()
+        self.array[col] = value
+        self.mask[col] = True
+
+    def __delitem__(self,key):
+        col = self.index.columns.get(key)
+        if col is None or col >= len(self.mask) or not self.mask[col]:
+            raise KeyError(key)
+        self._string = None
+        self._hash = None
+        self._columns = None
+        self.array[col] = 0.
+        self.mask[col] = False
+
+    def __contains__(self,key):
+        col = self.index.columns.get(key)
+        return col is not None and col < len(self.mask) and bool(self.mask[col])
+
+    def __len__(self):
+        return int(self.mask.sum())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return [self.index.keys[col] for col in numpy.flatnonzero(self.mask)]
+
+    def values(self):
+        return [float(value) for value in self.array[self.mask]]
+
+    def items(self):
+        return [(self.index.keys[col],float(self.array[col])) for col in numpy.flatnonzero(self.mask)]
+
+    def clear(self):
+        self._string = None
+        self._hash = None
+        self._columns = None
+        self.array[:] = 0.
+        self.mask[:] = False
+
+    def update(self,other):
+        if isinstance(other,ArrayVector) and other.index is self.index:
+            self._string = None
+            self._hash = None
+            self._columns = None
+            self._grow()
+            other._grow()
+            numpy.copyto(self.array,other.array,where=other.mask)
+            self.mask |= other.mask
+        else:
+            for key,value in other.items():
+                self[key] = value
+
+    def copy(self):
+        return self.__class__(self)
+
+    def freeze(self):
+        # Keep array storage; a fresh copy is not shared with any other holder
+        return self.__class__(self)
+
+    def __eq__(self,other):
+        if isinstance(other,ArrayVector) and other.index is self.index:
+            self._grow()
+            other._grow()
+            return numpy.abs(self.array-other.array).sum() < self.epsilon
+        else:
+            return KeyedVector.__eq__(self,other)
+
+    def __ne__(self,other):
+        return not self == other
+
+    def __neg__(self):
+        result = self.__class__(self)
+        result.array = -result.array
+        return result
+
+    def __mul__(self,other):
+        if isinstance(other,ArrayVector) and other.index is self.index:
+            # Dot product over columns present in both
+            self._grow()
+            other._grow()
+            return float(numpy.dot(self.array,other.array))
+        elif isinstance(other,KeyedVector):
+            # Dot product with a sparse vector (e.g., hyperplane weights)
+            self._grow()
+            columns,weights = other.project(self.index)
+            return float(numpy.dot(self.array[columns],weights))
+        elif isinstance(other,float):
+            result = self.__class__(self)
+            result.array *= other
+            return result
+        else:
+            return NotImplemented
+
+    __hash__ = KeyedVector.__hash__
+
+    def __reduce__(self):
+        return (self.__class__,(dict(self.items()),self.index))
+
+    def parse(self,element):
+        self.clear()
+        self.update(KeyedVector(element))
+
 class VectorDistribution(Distribution):
     """
     A class representing a L{Distribution} over L{KeyedVector} instances
@@ -181,19 +632,14 @@ class VectorDistribution(Distribution):
         @type key: str
         @param value: either a single value to apply to all vectors, or else a L{Distribution} over possible values
         """
-        original = dict(self)
-        domain = self.domain()
+        original = [(row,self[row]) for row in self.domain()]
         self.clear()
-        for row in domain:
-            prob = original[str(row)]
+        for row,prob in original:
             if isinstance(value,Distribution):
                 for element in value.domain():
-                    new = row.__class__(row)
-                    new[key] = element
-                    self.addProb(new,prob*value[element])
+                    self.addProb(row.alter({key: element}),prob*value[element])
             else:
-                row[key] = value
-                self[row] = prob
+                self.addProb(row.alter({key: value}),prob)
 
     def merge(self,other):
         """
@@ -205,9 +651,7 @@ class VectorDistribution(Distribution):
         result = {}
         for diff in other.domain():
             for old in self.domain():
-                new = old.__class__(old)
-                new.update(diff)
-                result[new] = self[old]*other[diff]
+                result[old.alter(diff)] = self[old]*other[diff]
         return self.__class__(result)
         
     def element2xml(self,value):
@@ -225,9 +669,11 @@ class VectorDistribution(Distribution):
                 result[row[key]] = self[row]
         return Distribution(result)
 
-    def select(self,incremental=False):
+    def select(self,incremental=False,rng=None):
         """
         @param incremental: if C{True}, then select each key value in series (rather than picking out a joint vector all at once, default is C{False})
+        @param rng: the source of random numbers (default is the C{random} module)
+        @type rng: C{random.Random}
         """
         if incremental:
             # Sample each key and keep track how likely each individual choice was
@@ -239,7 +685,7 @@ class VectorDistribution(Distribution):
                 dist = self.marginal(key)
                 if len(dist) > 1:
                     # Have to make a choice here
-                    element,sample[key] = dist.sample(True)
+                    element,sample[key] = dist.sample(True,rng)
                     # Figure out where the "spinner" ended up across entire pie chart
                     for other in dist.domain():
                         if other == element:
@@ -253,8 +699,52 @@ class VectorDistribution(Distribution):
                 index += 1
             return sample
         else:
-            Distribution.select(self)
+            Distribution.select(self,rng)
             
+    def approximate(self,size=None,threshold=None,distance=None,transform=None):
+        """
+        Compresses this distribution to a bounded support (in place), then renormalizes it
+        @param size: the maximum number of vectors to keep, discarding the least likely ones (default is no limit)
+        @type size: int
+        @param threshold: the minimum probability of any vector to keep (default is no minimum)
+        @type threshold: float
+        @param distance: vectors within this Euclidean distance of a more likely vector are merged into it, with the combined probability (default is no merging)
+        @type distance: float
+        @param transform: the function to apply to each vector before computing distances, e.g., L{World.scaleState} (default is none)
+        @return: the probability mass discarded (merged vectors do not count as discarded)
+        @rtype: float
+        """
+        total = sum(self.values())
+        if total <= 0.:
+            return 0.
+        entries = [[vector,self[vector]] for vector in self.domain()]
+        entries.sort(key=lambda entry: -entry[1])
+        if distance is not None:
+            kept = []
+            for vector,prob in entries:
+                point = vector if transform is None else transform(vector)
+                for entry in kept:
+                    other = entry[2]
+                    diff = sum([(point.get(key,0.)-other.get(key,0.))**2
+                                for key in set(point.keys())|set(other.keys())])
+                    if diff <= distance*distance:
+                        entry[1] += prob
+                        break
+                else:
+                    kept.append([vector,prob,point])
+            entries = [entry[:2] for entry in kept]
+            entries.sort(key=lambda entry: -entry[1])
+        if threshold is not None:
+            # Always keep at least the most likely vector
+            entries = entries[:1]+[entry for entry in entries[1:] if entry[1]/total >= threshold]
+        if size is not None:
+            entries = entries[:max(size,1)]
+        mass = sum([entry[1] for entry in entries])
+        self.clear()
+        for vector,prob in entries:
+            self[vector] = prob/mass
+        return 1.-mass/total
+
     def hasColumn(self,key):
         """
         @return: C{True} iff the given key appears in all of the vectors of this distribution
@@ -275,3 +765,260 @@ class VectorDistribution(Distribution):
                 memo[id(vector)] = new
             result[new] = self[vector]
         return result
+
+class ArrayDistribution(VectorDistribution):
+    """
+    A L{VectorDistribution} that stores its possible worlds as the rows of a 2-D array (with C{nan} marking absent keys) plus a column of probabilities.
+    L{join}, L{merge}, L{marginal}, L{normalize}, and L{select} operate on the whole array at once, and duplicate worlds are merged in a single pass.
+    @ivar index: the column assignment for the keys of the stored worlds
+    @type index: L{FeatureIndex}
+    """
+    def __init__(self,args=None,index=None):
+        dict.__init__(self)
+        self._domain = {}
+        if index is None:
+            if isinstance(args,ArrayDistribution):
+                index = args.index
+            else:
+                index = FeatureIndex()
+        self.index = index
+        self.size = 0
+        self.rows = numpy.empty((0,len(index)))
+        self.probs = numpy.empty(0)
+        self._lookup = {}
+        self._vectors = None
+        self._sampler = None
+        if isinstance(args,ArrayDistribution) and args.index is index:
+            self.rows = args.rows[:args.size].copy()
+            self.probs = args.probs[:args.size].copy()
+            self.size = args.size
+            self._lookup = dict(args._lookup)
+        elif isinstance(args,Node):
+            self.parse(args)
+        elif isinstance(args,Distribution):
+            for vector in args.domain():
+                self.addProb(vector,args[vector])
+        elif args is not None:
+            for vector,prob in args.items():
+                self.addProb(vector,prob)
+
+    def _grow(self):
+        """
+        Extends my rows to cover any columns added to the index since they were created
+        """
+        extra = len(self.index) - self.rows.shape[1]
+        if extra > 0:
+            self.rows = numpy.hstack((self.rows,numpy.full((len(self.rows),extra),numpy.nan)))
+            # The lookup keys are the bytes of the rows, so they change with the width
+            self._lookup = {self.rows[pos].tobytes(): pos for pos in range(self.size)}
+
+    def _reset(self,rows,probs):
+        """
+        Replaces my contents with the given rows and probabilities, merging any duplicate rows
+        """
+        if len(rows) > 0:
+            rows = rows + 0.
+            view = numpy.ascontiguousarray(rows).view(numpy.dtype((numpy.void,rows.dtype.itemsize*rows.shape[1])))
+            unique,first,inverse = numpy.unique(view.ravel(),return_index=True,return_inverse=True)
+            rows = rows[first]
+            probs = numpy.bincount(inverse.ravel(),weights=probs,minlength=len(unique))
+        self.rows = rows
+        self.probs = probs
+        self.size = len(rows)
+        self._lookup = {self.rows[pos].tobytes(): pos for pos in range(self.size)}
+        self._vectors = None
+        self._sampler = None
+
+    def row(self,vector,add=False):
+        """
+        @param add: if C{True}, then add columns for any keys of the given vector that are not yet in my index (default is C{False})
+        @type add: bool
+        @return: the row encoding the given vector (C{None} if the vector has keys not in my index and C{add} is C{False})
+        """
+        if isinstance(vector,ArrayVector) and vector.index is self.index:
+            vector._grow()
+            self._grow()
+            row = numpy.where(vector.mask,vector.array,numpy.nan)
+        else:
+            for key in vector.keys():
+                if add:
+                    self.index.add(key)
+                elif key not in self.index:
+                    # No stored world can have this key
+                    return None
+            self._grow()
+            row = numpy.full(len(self.index),numpy.nan)
+            for key,value in vector.items():
+                row[self.index.columns[key]] = value
+        if len(row) < self.rows.shape[1]:
+            row = numpy.concatenate((row,numpy.full(self.rows.shape[1]-len(row),numpy.nan)))
+        return row + 0.
+
+    def vector(self,row):
+        """
+        @return: the vector encoded by the given row
+        @rtype: L{ArrayVector}
+        """
+        vector = ArrayVector(index=self.index)
+        vector._grow()
+        vector.mask = ~numpy.isnan(row)
+        vector.array = numpy.where(vector.mask,row,0.)
+        return vector
+
+    def __getitem__(self,element):
+        row = self.row(element)
+        if row is None:
+            raise KeyError(element)
+        return float(self.probs[self._lookup[row.tobytes()]])
+
+    def __setitem__(self,element,value):
+        row = self.row(element,True)
+        self._sampler = None
+        try:
+            self.probs[self._lookup[row.tobytes()]] = value
+            return
+        except KeyError:
+            pass
+        if self.size == len(self.rows):
+            # Double capacity
+            capacity = max(2*self.size,4)
+            self.rows = numpy.vstack((self.rows,numpy.full((capacity-self.size,self.rows.shape[1]),numpy.nan)))
+            self.probs = numpy.concatenate((self.probs,numpy.zeros(capacity-self.size)))
+        self.rows[self.size] = row
+        self.probs[self.size] = value
+        self._lookup[row.tobytes()] = self.size
+        self.size += 1
+        self._vectors = None
+
+    def __delitem__(self,element):
+        row = self.row(element)
+        if row is None:
+            raise KeyError(element)
+        pos = self._lookup.pop(row.tobytes())
+        last = self.size-1
+        if pos < last:
+            # Move last row into the vacated slot
+            self.rows[pos] = self.rows[last]
+            self.probs[pos] = self.probs[last]
+            self._lookup[self.rows[pos].tobytes()] = pos
+        self.size = last
+        self._vectors = None
+        self._sampler = None
+
+    def __contains__(self,element):
+        row = self.row(element)
+        return row is not None and row.tobytes() in self._lookup
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.domain())
+
+    def keys(self):
+        return self.domain()
+
+    def values(self):
+        return [float(prob) for prob in self.probs[:self.size]]
+
+    def items(self):
+        return list(zip(self.domain(),self.values()))
+
+    def clear(self):
+        self.size = 0
+        self._lookup.clear()
+        self._vectors = None
+        self._sampler = None
+
+    def domain(self):
+        if self._vectors is None:
+            self._grow()
+            self._vectors = [self.vector(self.rows[pos]) for pos in range(self.size)]
+        return list(self._vectors)
+
+    def normalize(self):
+        total = self.probs[:self.size].sum()
+        if abs(total-1.) > self.epsilon:
+            if total == 0.:
+                self.probs[:self.size] = 1./float(self.size)
+            else:
+                self.probs[:self.size] /= total
+
+    def sampler(self):
+        if self._sampler is None:
+            self._sampler = AliasSampler(self.domain(),self.probs[:self.size])
+        return self._sampler
+
+    def join(self,key,value):
+        col = self.index.add(key)
+        self._grow()
+        rows = self.rows[:self.size]
+        probs = self.probs[:self.size]
+        if isinstance(value,Distribution):
+            elements = value.domain()
+            weights = numpy.array([value[element] for element in elements])
+            rows = numpy.repeat(rows,len(elements),axis=0)
+            rows[:,col] = numpy.tile(numpy.array(elements,dtype=float),self.size)
+            probs = numpy.repeat(probs,len(elements))*numpy.tile(weights,self.size)
+        else:
+            rows = rows.copy()
+            rows[:,col] = value
+            probs = probs.copy()
+        self._reset(rows,probs)
+
+    def merge(self,other):
+        if not isinstance(other,ArrayDistribution) or other.index is not self.index:
+            other = self.__class__(other,self.index)
+        self._grow()
+        other._grow()
+        mine = self.rows[:self.size]
+        diffs = other.rows[:other.size]
+        rows = numpy.where(numpy.isnan(diffs[:,None,:]),mine[None,:,:],diffs[:,None,:])
+        probs = numpy.outer(other.probs[:other.size],self.probs[:self.size])
+        result = self.__class__(index=self.index)
+        result._reset(rows.reshape(-1,mine.shape[1]),probs.ravel())
+        return result
+
+    def marginal(self,key):
+        col = self.index.columns[key]
+        self._grow()
+        values = self.rows[:self.size,col]
+        if numpy.isnan(values).any():
+            raise KeyError(key)
+        unique,inverse = numpy.unique(values,return_inverse=True)
+        probs = numpy.bincount(inverse.ravel(),weights=self.probs[:self.size],minlength=len(unique))
+        return Distribution({float(unique[i]): float(probs[i]) for i in range(len(unique))})
+
+    def select(self,incremental=False,rng=None):
+        if incremental:
+            return VectorDistribution.select(self,True,rng)
+        vector = self.sample(rng=rng)
+        pos = self._lookup[self.row(vector).tobytes()]
+        prob = float(self.probs[pos])
+        self._reset(self.rows[pos:pos+1].copy(),numpy.ones(1))
+        return prob
+
+    def hasColumn(self,key):
+        col = self.index.columns.get(key)
+        if col is None:
+            return self.size == 0
+        self._grow()
+        return not numpy.isnan(self.rows[:self.size,col]).any()
+
+    def __xml__(self):
+        return VectorDistribution({vector: self[vector] for vector in self.domain()}).__xml__()
+
+    def parse(self,element):
+        self.clear()
+        original = VectorDistribution(element)
+        for vector in original.domain():
+            self.addProb(vector,original[vector])
+
+    def __copy__(self):
+        return self.__class__(self)
+
+    def __deepcopy__(self,memo):
+        return self.__class__(self)
+
+    def __reduce__(self):
+        return (self.__class__,(None,self.index),None,None,iter(self.items()))
@@ -1,3 +1,4 @@
+import json
 import unittest
 import random
 
@@ -104,6 +105,216 @@ class TestPWL(unittest.TestCase):
                 for key in list(product.keys()):
                     self.assertAlmostEqual(product[key],v2[key],8)
 
+    def testArrayVector(self):
+        # Matrix products stay in array form only for rows already in the index
+        index = FeatureIndex(self.makeVector().keys())
+        for iteration in range(100):
+            v1 = self.makeVector(gap=0.2)
+            v2 = self.makeVector(gap=0.2)
+            a1 = ArrayVector(v1,index)
+            a2 = ArrayVector(v2,index)
+            self.assertEqual(set(a1.keys()),set(v1.keys()))
+            self.assertEqual(str(a1),str(v1))
+            self.assertEqual(a1,v1)
+            self.assertAlmostEqual(a1*a2,v1*v2,8)
+            self.assertAlmostEqual(v1*a2,v1*v2,8)
+            matrix = self.makeMatrix(colgap=0.5)
+            product = matrix*a1
+            self.assertIsInstance(product,ArrayVector)
+            self.assertEqual(product,matrix*v1)
+            plane = self.makePlane(gap=0.5)
+            self.assertEqual(plane.evaluate(a1),plane.evaluate(v1))
+            a1.update(product)
+            v1.update(matrix*v1)
+            self.assertEqual(a1,v1)
+        # Multiplying by a matrix with rows outside the index leaves the index alone
+        width = len(index)
+        matrix = KeyedMatrix({'Unknown': KeyedVector({'A': 2.})})
+        self.assertRaises(KeyError,matrix.dense,index)
+        product = matrix*ArrayVector(KeyedVector({'A': 1.}),index)
+        self.assertEqual(product,KeyedVector({'Unknown': 2.}))
+        self.assertEqual(len(index),width)
+
+    def testArrayDistribution(self):
+        for iteration in range(20):
+            dist = VectorDistribution()
+            for index in range(5):
+                dist.addProb(self.makeVector(4),random.random())
+            dist.normalize()
+            array = ArrayDistribution(dist)
+            self.assertEqual(len(array),len(dist))
+            for vector in dist.domain():
+                self.assertAlmostEqual(array[vector],dist[vector],8)
+            # Looking up a world with an unknown key leaves the index alone
+            width = len(array.index)
+            self.assertNotIn(KeyedVector({'A': 0.,'Unknown': 1.}),array)
+            self.assertRaises(KeyError,array.__getitem__,KeyedVector({'Unknown': 1.}))
+            self.assertEqual(len(array.index),width)
+            values = Distribution({0.: 0.25,1.: 0.75})
+            dist.join('E',values)
+            array.join('E',values)
+            self.assertEqual(len(array),len(dist))
+            marginal = array.marginal('E')
+            self.assertAlmostEqual(marginal[1.],0.75,8)
+            # Setting a column to a constant merges duplicate worlds
+            array.join('E',0.)
+            self.assertEqual(len(array),len(dist)/2)
+            self.assertAlmostEqual(sum(array.values()),1.,8)
+            diff = VectorDistribution({KeyedVector({'A': 0.}): 0.5,KeyedVector({'A': 1.}): 0.5})
+            merged = array.merge(diff)
+            self.assertAlmostEqual(merged.marginal('A')[1.],0.5,8)
+            self.assertAlmostEqual(sum(merged.values()),1.,8)
+            array.select()
+            self.assertEqual(len(array),1)
+        # Worlds stored before the index grows are still found afterward
+        array = ArrayDistribution()
+        first = KeyedVector({'X': 1.,'Y': 2.})
+        array[first] = 0.5
+        array[KeyedVector({'X': 1.,'Z': 2.})] = 0.25
+        self.assertAlmostEqual(array[first],0.5,8)
+        array.addProb(KeyedVector({'X': 1.,'Y': 2.}),0.25)
+        self.assertEqual(len(array),2)
+        self.assertAlmostEqual(array[first],0.75,8)
+        self.assertAlmostEqual(sum(array.values()),1.,8)
+
+    def testStructuralKeys(self):
+        for iteration in range(20):
+            dist = VectorDistribution()
+            vector = self.makeVector()
+            dist[vector] = 0.5
+            same = KeyedVector(vector)
+            self.assertEqual(hash(same),hash(vector))
+            self.assertIn(same,dist)
+            self.assertAlmostEqual(dist[same],0.5,8)
+            tree = self.makeTree(depth=2)
+            trees = Distribution({tree: 1.})
+            self.assertEqual(trees.domain(),[tree])
+            matrix = self.makeMatrix()
+            self.assertEqual(hash(KeyedMatrix(matrix)),hash(matrix))
+            self.assertEqual(KeyedMatrix(matrix),matrix)
+        # Values within epsilon of each other (e.g., float rounding) must still land under one key
+        vector = KeyedVector({'A': 0.1+0.2,'B': 1./3.,'C': 2.5})
+        nudged = KeyedVector({'A': 0.3,'B': 1./3.+KeyedVector.epsilon/100.,'C': 2.5-KeyedVector.epsilon/100.})
+        self.assertNotEqual(dict(nudged),dict(vector))
+        self.assertEqual(nudged,vector)
+        self.assertEqual(hash(nudged),hash(vector))
+        dist = VectorDistribution({vector: 0.5})
+        dist.addProb(nudged,0.5)
+        self.assertEqual(len(dist),1)
+        delta = DeltaVector(vector,{'C': nudged['C']})
+        self.assertEqual(hash(delta),hash(vector))
+        tree = makeTree({'if': KeyedPlane(vector,0.5),True: KeyedMatrix({'A': vector}),False: None})
+        other = makeTree({'if': KeyedPlane(nudged,0.5),True: KeyedMatrix({'A': nudged}),False: None})
+        self.assertEqual(tree,other)
+        self.assertEqual(hash(tree),hash(other))
+        trees = Distribution({tree: 0.5})
+        trees.addProb(other,0.5)
+        self.assertEqual(len(trees),1)
+
+    def testFrozenVector(self):
+        for iteration in range(20):
+            vector = self.makeVector()
+            frozen = vector.freeze()
+            self.assertEqual(frozen,vector)
+            self.assertEqual(hash(frozen),hash(vector))
+            self.assertRaises(TypeError,frozen.__setitem__,'A',1.)
+            self.assertRaises(TypeError,frozen.update,{'A': 1.})
+            new = frozen.alter({'A': 2.,'Z': 3.})
+            self.assertIsInstance(new,FrozenKeyedVector)
+            self.assertEqual(new['A'],2.)
+            self.assertEqual(new['Z'],3.)
+            self.assertEqual(frozen,vector)
+            # Joining leaves the stored vectors untouched
+            dist = VectorDistribution({frozen: 1.})
+            dist.join('Z',Distribution({0.: 0.5,1.: 0.5}))
+            self.assertEqual(len(dist),2)
+            self.assertNotIn('Z',frozen)
+
+    def testCompiledTree(self):
+        for iteration in range(20):
+            tree = self.makeTree(planegap=0.5)
+            compiled = tree.compile()
+            vectors = [self.makeVector(gap=0.25) for index in range(20)]
+            positions,leaves,probs = compiled.evaluate(vectors)
+            self.assertEqual(list(positions),list(range(len(vectors))))
+            for position,leaf in zip(positions,leaves):
+                self.assertIs(compiled.leaves[leaf],tree[vectors[position]])
+            # Probabilistic branch over two subtrees
+            root = KeyedTree()
+            root.makeProbabilistic(Distribution({tree: 0.25,self.makeTree(depth=1): 0.75}))
+            compiled = root.compile()
+            positions,leaves,probs = compiled.evaluate(vectors)
+            self.assertEqual(len(positions),2*len(vectors))
+            for position in range(len(vectors)):
+                self.assertAlmostEqual(probs[positions == position].sum(),1.,8)
+                expected = root[vectors[position]]
+                result = compiled[vectors[position]]
+                for leaf in expected.domain():
+                    self.assertAlmostEqual(result[leaf],expected[leaf],8)
+
+    def testDeltaVector(self):
+        for iteration in range(20):
+            base = self.makeVector().freeze()
+            changes = self.makeVector(4,0.5)
+            changes['Z'] = 1.
+            new = base.alter(changes)
+            self.assertIsInstance(new,DeltaVector)
+            expected = KeyedVector(base)
+            expected.update(changes)
+            self.assertEqual(hash(new),hash(expected))
+            self.assertEqual(len(new),len(expected))
+            for key in expected:
+                self.assertIn(key,new)
+                self.assertEqual(new[key],expected[key])
+            # Changes on top of changes share the original base
+            newer = new.alter({'A': 2.})
+            expected['A'] = 2.
+            self.assertEqual(hash(newer),hash(expected))
+            self.assertEqual(newer,base.alter({'A': 2.}).alter(changes).alter({'A': 2.}))
+            self.assertEqual(dict(newer.items()),dict(expected))
+            self.assertEqual(newer,expected)
+            # Code that reads the table of values directly sees them all
+            self.assertEqual(base.alter(changes).copy(),dict(new.items()))
+            self.assertEqual(json.loads(json.dumps(base.alter(changes).alter({'A': 2.}))),dict(expected.items()))
+            self.assertEqual(json.loads(json.dumps(base.alter({}))),dict(base.items()))
+
+    def testAliasSampler(self):
+        dist = Distribution({'A': 0.5,'B': 0.3,'C': 0.2,'D': 0.})
+        samples = dist.sampler().sample(20000)
+        for element in dist.domain():
+            self.assertAlmostEqual(samples.count(element)/20000.,dist[element],1)
+        self.assertNotIn('D',[dist.sample() for iteration in range(100)])
+        # Changes discard the alias table
+        dist['D'] = 10.
+        self.assertAlmostEqual(dist.sampler().sample(1000).count('D')/1000.,10./11.,1)
+
+    def testApproximation(self):
+        vectors = [KeyedVector({'A': float(index)}) for index in range(5)]
+        dist = VectorDistribution({vectors[0]: 0.4,vectors[1]: 0.3,vectors[2]: 0.15,
+                                   vectors[3]: 0.1,vectors[4]: 0.05})
+        self.assertAlmostEqual(dist.approximate(threshold=0.1),0.05,8)
+        self.assertEqual(len(dist),4)
+        self.assertAlmostEqual(sum(dist.values()),1.,8)
+        self.assertAlmostEqual(dist.approximate(size=2),0.25/0.95,8)
+        self.assertEqual(set(dist.domain()),set(vectors[:2]))
+        self.assertAlmostEqual(dist[vectors[0]],4./7.,8)
+        # Merging moves probability without discarding it
+        dist = VectorDistribution({vectors[0]: 0.4,vectors[1]: 0.3,vectors[3]: 0.3})
+        self.assertAlmostEqual(dist.approximate(distance=1.5),0.,8)
+        self.assertEqual(len(dist),2)
+        self.assertAlmostEqual(dist[vectors[0]],0.7,8)
+        self.assertAlmostEqual(dist[vectors[3]],0.3,8)
+
+    def testResample(self):
+        dist = Distribution({'A': 0.5,'B': 0.3,'C': 0.15,'D': 0.05})
+        dist.resample(10)
+        self.assertAlmostEqual(sum(dist.values()),1.,8)
+        # Systematic resampling keeps each count within one of its expectation
+        self.assertAlmostEqual(dist['A'],0.5,8)
+        self.assertAlmostEqual(dist['B'],0.3,8)
+        self.assertIn(dist.getProb('C'),[0.1,0.2])
+        self.assertIn(dist.getProb('D'),[0.,0.1])
+
     def DONTtestTreeAddition(self):
         for iteration in range(100):
             t1 = self.makeTree(colgap=0.75,planegap=0.75)
@@ -1,8 +1,14 @@
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
 import unittest
 
 from psychsim.action import *
 from psychsim.world import *
 from psychsim.agent import Agent
+from psychsim.history import LogHistory
 from psychsim.pwl import *
 from psychsim.reward import *
 
@@ -227,6 +233,479 @@ class TestAgents(unittest.TestCase):
             outcome = self.world.step({self.tom.name: self.hit})
             self.saveload()
 
+    def testBatchStep(self):
+        self.world.setOrder([self.tom.name])
+        self.addStates()
+        self.addActions()
+        jerry = stateKey(self.jerry.name,'health')
+        tom = stateKey(self.tom.name,'health')
+        tree = makeTree({'if': thresholdRow(jerry,55),
+                         True: incrementMatrix(jerry,-20),
+                         False: incrementMatrix(jerry,-10)})
+        self.world.setDynamics(jerry,self.hit,tree)
+        tree = makeTree({'distribution': [(incrementMatrix(tom,-5),0.25),(noChangeMatrix(tom),0.75)]})
+        self.world.setDynamics(tom,self.hit,tree)
+        self.world.setState(self.jerry.name,'health',Distribution({40: 0.25,50: 0.25,70: 0.5}))
+        expected = self.world.step({self.tom.name: self.hit},real=False)
+        self.world.batch = True
+        outcomes = self.world.step({self.tom.name: self.hit},real=False)
+        self.assertEqual(len(outcomes),len(expected))
+        for outcome,original in zip(outcomes,expected):
+            self.assertEqual(outcome['old'],original['old'])
+            self.assertEqual(len(outcome['new']),2)
+            for vector in original['new'].domain():
+                self.assertAlmostEqual(outcome['new'][vector],original['new'][vector],8)
+            self.assertEqual(len(outcome['effect']),len(original['effect']))
+            for effect,expectedEffect in zip(outcome['effect'],original['effect']):
+                if isinstance(expectedEffect,KeyedMatrix):
+                    # Turn order update
+                    self.assertEqual(effect,expectedEffect)
+                    continue
+                self.assertEqual(len(effect),len(expectedEffect))
+                for matrix in expectedEffect.domain():
+                    matches = [other for other in effect.domain() if set(other.keys()) == set(matrix.keys()) and \
+                               all(abs(other[key][CONSTANT]-matrix[key][CONSTANT]) < 1e-8 for key in matrix)]
+                    self.assertEqual(len(matches),1)
+                    self.assertAlmostEqual(effect[matches[0]],expectedEffect[matrix],8)
+            self.assertEqual(len(outcome['effect'][0]),2)
+        self.world.step({self.tom.name: self.hit},select=False)
+        self.assertEqual(len(self.world.state[None]),6)
+        self.assertAlmostEqual(self.world.getFeature(tom).expectation(),50-5*0.25,8)
+
+    def testTransitionCache(self):
+        self.world.setOrder([self.tom.name])
+        self.addStates()
+        self.addActions()
+        self.addDynamics()
+        self.world.cacheTransitions(2)
+        key = stateKey(self.jerry.name,'health')
+        first = self.world.step({self.tom.name: self.hit},real=False)
+        second = self.world.step({self.tom.name: self.hit},real=False)
+        self.assertEqual(self.world.transitions.hits,1)
+        self.assertEqual(first[0]['new'].domain()[0][key],40)
+        self.assertEqual(second[0]['new'].domain()[0][key],40)
+        # Changing the dynamics discards cached transitions
+        tree = makeTree(incrementMatrix(key,-20))
+        self.world.setDynamics(key,self.hit,tree)
+        self.assertEqual(len(self.world.transitions),0)
+        outcome = self.world.step({self.tom.name: self.hit},real=False)
+        self.assertEqual(outcome[0]['new'].domain()[0][key],30)
+        self.world.step({self.tom.name: self.chase},real=False)
+        self.world.step({self.tom.name: self.run},real=False)
+        self.assertEqual(len(self.world.transitions),2)
+        self.assertEqual(self.world.transitions.evictions,1)
+
+    def testApproximation(self):
+        self.world.setOrder([self.tom.name])
+        self.addStates()
+        self.addActions()
+        tom = stateKey(self.tom.name,'health')
+        tree = makeTree({'distribution': [(incrementMatrix(tom,-5),0.1),(noChangeMatrix(tom),0.9)]})
+        self.world.setDynamics(tom,self.hit,tree)
+        self.world.setState(self.jerry.name,'health',Distribution({50: 0.5,51: 0.5}))
+        self.world.setApproximation(threshold=0.2,distance=0.02)
+        self.world.step({self.tom.name: self.hit},select=False)
+        # Jerry's health values merge, and the unlikely injury to Tom is discarded
+        self.assertEqual(len(self.world.state[None]),1)
+        self.assertAlmostEqual(self.world.discarded,0.1,8)
+        self.assertEqual(self.world.getFeature(tom).domain(),[50])
+        # Beliefs are approximated within the agent's models
+        self.world.setModel(self.jerry.name,True)
+        self.jerry.setBelief(tom,Distribution({50: 0.7,45: 0.3}))
+        self.jerry.setApproximation(size=1)
+        vector = self.world.state[None].domain()[0]
+        omega = self.jerry.observe(vector,{self.tom.name: self.hit}).domain()[0]
+        model = self.jerry.index2model(self.jerry.stateEstimator(vector,KeyedVector(vector),omega))
+        self.assertEqual(len(self.jerry.models[model]['beliefs']),1)
+        # Only the uninjured belief (0.7*0.9) survives the hit
+        self.assertAlmostEqual(self.jerry.models[model]['discarded'],0.37,8)
+
+    def testParticles(self):
+        self.world.setOrder([self.tom.name])
+        self.addStates()
+        self.addActions()
+        tom = stateKey(self.tom.name,'health')
+        tree = makeTree({'distribution': [(incrementMatrix(tom,-5),0.25),(noChangeMatrix(tom),0.75)]})
+        self.world.setDynamics(tom,self.hit,tree)
+        self.world.setState(self.jerry.name,'health',Distribution({value: 0.01 for value in range(100)}))
+        self.world.setParticles(50)
+        outcomes = self.world.step({self.tom.name: self.hit})
+        self.assertEqual(len(outcomes),50)
+        for outcome in outcomes:
+            self.assertEqual(len(outcome['new']),1)
+        self.assertLessEqual(len(self.world.state[None]),50)
+        self.assertAlmostEqual(sum(self.world.state[None].values()),1.,8)
+        for value in self.world.getFeature(tom).domain():
+            self.assertIn(value,[45,50])
+        # Skewed weights still cost exactly one sample per particle
+        weights = {value: 0.01 for value in range(9)}
+        weights[50] = 0.91
+        self.world.setState(self.jerry.name,'health',Distribution(weights))
+        self.world.setParticles(10)
+        outcomes = self.world.step({self.tom.name: self.hit})
+        self.assertEqual(len(outcomes),10)
+        self.assertAlmostEqual(sum(self.world.state[None].values()),1.,8)
+
+    def testBatchRuns(self):
+        from psychsim.tools.batch import runBatch
+        self.addStates()
+        self.addActions()
+        self.addDynamics()
+        self.world.setOrder([self.tom.name])
+        self.tom.setReward(minimizeFeature(stateKey(self.jerry.name,'health')),1.)
+        key = stateKey(self.jerry.name,'health')
+        configs = [{},{'state': {key: 30}},{'steps': 1}]
+        updates = []
+        results,stats = runBatch(self.world,configs,steps=2,processes=2,seed=0,
+                                 callback=lambda run,summary: updates.append(run))
+        self.assertEqual([result['steps'] for result in results],[2,2,1])
+        self.assertEqual(sorted(updates),[0,0,1,1,2])
+        self.assertEqual([result['measures'][key] for result in results],[30.,10.,40.])
+        self.assertAlmostEqual(stats[key]['mean'],80./3.,8)
+        # Runs in the workers leave the original world untouched
+        self.assertEqual(self.world.getValue(key),50)
+
+    def testRandomStreams(self):
+        runs = []
+        for run in range(2):
+            self.setUp()
+            self.world.setOrder([self.tom.name])
+            self.addStates()
+            self.addActions()
+            tom = stateKey(self.tom.name,'health')
+            tree = makeTree({'distribution': [(incrementMatrix(tom,-5),0.5),(noChangeMatrix(tom),0.5)]})
+            self.world.setDynamics(tom,self.hit,tree)
+            self.tom.setAttribute('selection','random')
+            self.world.seed(1234)
+            history = []
+            for t in range(5):
+                outcomes = self.world.step()
+                history.append((str(outcomes[0]['actions']),self.world.getValue(tom)))
+            runs.append(history)
+        self.assertEqual(runs[0],runs[1])
+        # Each agent has its own stream, independent of the world's
+        self.assertNotEqual(self.tom.rng.random(),self.world.rng.random())
+        self.assertEqual(self.world.stream('run1').random(),self.world.stream('run1').random())
+
+    def testFork(self):
+        self.addStates()
+        self.addActions()
+        self.addDynamics()
+        self.world.setOrder([self.tom.name])
+        self.world.setModel(self.jerry.name,True)
+        key = stateKey(self.jerry.name,'health')
+        self.jerry.setBelief(key,Distribution({20: 0.5,50: 0.5}))
+        models = len(self.jerry.models)
+        fork = self.world.fork()
+        self.assertIs(fork.agents[self.tom.name].world,fork)
+        self.assertIs(fork.dynamics[key][self.hit],self.world.dynamics[key][self.hit])
+        fork.step({self.tom.name: self.hit})
+        fork.agents[self.tom.name].setReward(minimizeFeature(key),1.)
+        fork.agents[self.jerry.name].setBelief(key,10)
+        self.assertEqual(fork.getValue(key),40)
+        self.assertEqual(self.world.getValue(key),50)
+        self.assertEqual(len(self.world.history),0)
+        self.assertEqual(len(self.jerry.models),models)
+        self.assertEqual(len(self.tom.getAttribute('R',True)),0)
+        self.assertEqual(len(self.jerry.getAttribute('beliefs',True)),2)
+
+    def testHistory(self):
+        self.addStates()
+        self.addActions()
+        self.addDynamics()
+        self.world.setOrder([self.tom.name])
+        key = stateKey(self.jerry.name,'health')
+        self.world.setHistory(size=2)
+        for t in range(3):
+            self.world.step({self.tom.name: self.hit})
+        self.assertEqual(len(self.world.history),2)
+        self.assertEqual(self.world.history[0][0]['old'][key],40)
+        filename = tempfile.mktemp(suffix='.jsonl')
+        try:
+            self.world.setHistory(filename=filename)
+            for t in range(2):
+                self.world.step({self.tom.name: self.hit})
+            self.assertEqual(len(self.world.history),2)
+            outcome = self.world.history[-1][0]
+            self.assertEqual(outcome['old'][key],10)
+            self.assertEqual(outcome['delta'].domain()[0][key],-10)
+            self.assertEqual(self.world.explainAction(outcome),{self.hit})
+            self.assertEqual([outcomes[0]['old'][key] for outcomes in self.world.history],[20,10])
+            # A fork starts its own history, rather than copying the log
+            fork = self.world.fork()
+            self.assertEqual(len(fork.history),0)
+            fork.step({self.tom.name: self.hit})
+            self.assertEqual(len(fork.history),1)
+            self.assertEqual(len(self.world.history),2)
+            self.world.history.close()
+            log = LogHistory(filename,True)
+            self.assertEqual(len(log),2)
+            self.assertEqual(log[0][0]['new'].domain()[0][key],10)
+            log.close()
+        finally:
+            os.remove(filename)
+
+    def testExplanation(self):
+        self.addStates()
+        self.addActions()
+        self.addDynamics()
+        self.world.setOrder([self.tom.name])
+        self.tom.setReward(minimizeFeature(stateKey(self.jerry.name,'health')),1.)
+        self.tom.setHorizon(2)
+        vector = self.world.state[None].domain()[0]
+        full = self.tom.decide(vector,explanation='projection')
+        self.assertEqual(full['action'],self.hit)
+        self.assertGreater(len(full['V'][self.hit][vector]['projection']),0)
+        values = self.tom.decide(vector,explanation='value')
+        self.assertEqual(values['action'],self.hit)
+        self.assertNotIn('projection',values['V'][self.hit][vector])
+        for action in [self.hit,self.chase]:
+            self.assertAlmostEqual(values['V'][action]['__EV__'],full['V'][action]['__EV__'],8)
+        self.world.explanation = 'action'
+        outcome = self.world.step()[0]
+        decision = outcome['decisions'][self.tom.name]
+        self.assertEqual(decision['action'],self.hit)
+        self.assertNotIn('V',decision)
+        self.assertAlmostEqual(decision['V*'],full['V*'],8)
+
+    def testTermination(self):
+        self.addStates()
+        self.addActions()
+        self.addDynamics()
+        self.world.setOrder([self.tom.name])
+        key = stateKey(self.jerry.name,'health')
+        self.world.addTermination(makeTree({'if': thresholdRow(key,25),True: False,False: True}))
+        self.assertEqual(self.world.getTerminationKeys(),[key])
+        self.assertFalse(self.world.terminated())
+        vector = self.world.state[None].domain()[0]
+        states = VectorDistribution({vector.alter({key: value}): 0.25 for value in [10,20,30,40]})
+        self.assertEqual(self.world.terminatedBatch(states),[True,True,False,False])
+        self.assertFalse(self.world.terminated(states))
+        # Memoized on Jerry's health alone
+        self.assertTrue(self.world.terminated(vector.alter({key: 20,stateKey(self.tom.name,'health'): 0})))
+        self.assertGreater(self.world.terminal.hits,0)
+        for t in range(3):
+            self.world.step({self.tom.name: self.hit})
+        self.assertTrue(self.world.terminated())
+        self.world.addTermination(makeTree({'if': thresholdRow(stateKey(self.tom.name,'health'),25),True: True,False: False}))
+        self.assertEqual(len(self.world.terminal),0)
+        self.assertEqual(len(self.world.getTerminationKeys()),2)
+        # Both conditions are fused into one tree
+        tom = stateKey(self.tom.name,'health')
+        fused = self.world.getTerminationTree()
+        for jerryHealth,tomHealth,expected in [(10,10,True),(50,50,True),(50,10,False)]:
+            state = vector.alter({key: jerryHealth,tom: tomHealth})
+            self.assertEqual(bool(fused[state]),expected)
+            self.assertEqual(self.world.terminated(state),expected)
+        # Replacing a condition in place discards the memo
+        self.world.termination[1] = makeTree({'if': thresholdRow(tom,75),True: False,False: True})
+        self.assertTrue(self.world.terminated(vector.alter({key: 50,tom: 10})))
+        self.assertEqual(self.world.terminatedBatch([vector.alter({key: 50,tom: value}) for value in [50,80]]),[True,False])
+
+    def testDynamicsDispatch(self):
+        self.addStates()
+        self.addActions()
+        key = stateKey(self.jerry.name,'health')
+        self.world.setDynamics(key,self.hit,makeTree(incrementMatrix(key,'-%s' % (actionKey('amount')))))
+        vector = self.world.state[None].domain()[0]
+        hard = Action({'subject': self.tom.name,'verb': 'hit','object': self.jerry.name,'amount': 20})
+        dynamics = self.world.getDynamics(key,hard)
+        self.assertEqual(len(dynamics),1)
+        self.assertEqual((dynamics[0][vector]*vector)[key],30)
+        self.assertIs(self.world.getDynamics(key,ActionSet([hard])),dynamics)
+        soft = Action({'subject': self.tom.name,'verb': 'hit','object': self.jerry.name,'amount': 5})
+        joint = ActionSet([soft]+list(self.run))
+        self.assertEqual((self.world.getDynamics(key,joint)[0][vector]*vector)[key],45)
+        self.assertIs(self.world.getDynamics(key,soft)[0],self.world.getDynamics(key,joint)[0])
+        self.assertEqual(len(self.world.desymbolized[key]),2)
+        self.assertEqual(self.world.getDynamics(key,self.chase),[])
+        # Varying parameters do not grow the caches without bound
+        self.world.dispatchSize = 4
+        self.world.setDynamics(key,self.hit,makeTree(incrementMatrix(key,'-%s' % (actionKey('amount')))))
+        for amount in range(10):
+            action = Action({'subject': self.tom.name,'verb': 'hit','object': self.jerry.name,'amount': amount})
+            self.assertEqual((self.world.getDynamics(key,action)[0][vector]*vector)[key],50-amount)
+        self.assertEqual(len(self.world.dispatch[key]),4)
+        self.assertEqual(len(self.world.desymbolized[key]),4)
+        # Redefining the dynamics discards the resolved trees
+        self.addDynamics()
+        self.assertNotIn(key,self.world.dispatch)
+        self.assertEqual((self.world.getDynamics(key,hard)[0][vector]*vector)[key],40)
+
+    def testLookahead(self):
+        self.addStates()
+        self.addActions()
+        self.addDynamics()
+        self.world.setOrder([self.tom.name])
+        self.tom.setReward(minimizeFeature(stateKey(self.jerry.name,'health')),1.)
+        self.tom.setHorizon(2)
+        vector = self.world.state[None].domain()[0]
+        decision = self.tom.decide(vector)
+        stats = self.tom.lookaheadStats(True)[True]
+        self.assertGreater(stats['size'],0)
+        self.assertEqual(stats['solved'],0)
+        self.assertEqual(self.tom.decide(vector)['V*'],decision['V*'])
+        self.assertGreater(self.tom.lookaheadStats(True)[True]['hits'],stats['hits'])
+        self.tom.setLookahead(2)
+        stats = self.tom.lookaheadStats(True)[True]
+        self.assertEqual(stats['size'],2)
+        self.assertGreater(stats['evictions'],0)
+        self.assertEqual(self.tom.decide(vector)['V*'],decision['V*'])
+        self.assertLessEqual(len(self.tom.getLookahead(True)),2)
+        doc = self.tom.__xml__()
+        self.assertEqual(len(doc.getElementsByTagName('cache')),0)
+        self.assertEqual(Agent(doc.documentElement).models[True]['lookahead'],2)
+
+    def testPlanner(self):
+        self.addStates()
+        self.addActions()
+        self.addDynamics()
+        self.world.setOrder([self.tom.name])
+        self.tom.setReward(minimizeFeature(stateKey(self.jerry.name,'health')),1.)
+        self.tom.setHorizon(3)
+        vector = self.world.state[None].domain()[0]
+        exact = self.tom.decide(vector)
+        self.tom.setPlanner(iterations=100)
+        self.world.seed(1)
+        decision = self.tom.decide(vector)
+        self.assertEqual(decision['action'],self.hit)
+        self.assertEqual(set(decision['V'].keys()),{self.hit,self.chase})
+        self.assertGreater(decision['V'][self.hit]['__EV__'],decision['V'][self.chase]['__EV__'])
+        self.assertLessEqual(decision['V*'],exact['V*']+1e-8)
+        self.world.seed(1)
+        self.assertEqual(self.tom.decide(vector)['V*'],decision['V*'])
+        self.tom.setPlanner(budget=0.)
+        self.assertEqual(len(self.tom.decide(vector)['V']),2)
+        doc = self.tom.__xml__()
+        self.assertEqual(Agent(doc.documentElement).models[True]['planner'],{'method': 'mcts','budget': 0.})
+        self.tom.setPlanner(None)
+        self.assertEqual(self.tom.decide(vector)['V*'],exact['V*'])
+
+    def testPruning(self):
+        self.addStates()
+        self.addActions()
+        # The bounds hold only for features kept within their ranges
+        key = stateKey(self.jerry.name,'health')
+        self.world.setDynamics(key,self.hit,makeTree(incrementMatrix(key,-10)),enforceMin=True,enforceMax=True)
+        self.world.setOrder([self.tom.name])
+        self.tom.setReward(minimizeFeature(stateKey(self.jerry.name,'health')),1.)
+        self.tom.setHorizon(2)
+        self.tom.setLookahead(0)
+        self.assertEqual(self.tom.rewardBounds(),(-1.,0.))
+        vector = self.world.state[None].domain()[0]
+        exact = self.tom.decide(vector,actions=[self.hit,self.chase])
+        self.assertNotIn('pruned',exact)
+        self.tom.setPruning()
+        decision = self.tom.decide(vector,actions=[self.hit,self.chase])
+        self.assertEqual(decision['action'],exact['action'])
+        self.assertEqual(decision['V*'],exact['V*'])
+        self.assertEqual(decision['pruned'],[self.chase])
+        self.assertEqual(set(decision['V'].keys()),{self.hit})
+        # Every value is needed for a distribution
+        decision = self.tom.decide(vector,selection='distribution',actions=[self.hit,self.chase])
+        self.assertNotIn('pruned',decision)
+        doc = self.tom.__xml__()
+        self.assertTrue(Agent(doc.documentElement).models[True]['prune'])
+        # The bounds are kept until the reward changes
+        self.assertEqual(self.tom.models[True]['bounds'],(-1.,0.))
+        self.tom.setReward(maximizeFeature(stateKey(self.tom.name,'health')),1.)
+        self.assertNotIn('bounds',self.tom.models[True])
+        self.assertEqual(self.tom.rewardBounds(),(-1.,1.))
+        # Dynamics that may leave the range rule out any bounds
+        self.world.setDynamics(key,self.chase,makeTree(incrementMatrix(key,-10)),enforceMin=True)
+        self.assertNotIn('bounds',self.tom.models[True])
+        self.assertIsNone(self.tom.rewardBounds())
+
+    def testPruningOutOfRange(self):
+        self.addStates()
+        self.addActions()
+        self.world.setOrder([self.tom.name])
+        key = stateKey(self.tom.name,'health')
+        self.world.setState(self.tom.name,'health',100)
+        # Neither effect is kept within the declared range
+        self.world.setDynamics(key,self.hit,makeTree(incrementMatrix(key,50)))
+        self.world.setDynamics(key,self.chase,makeTree(incrementMatrix(key,100)))
+        self.tom.setReward(maximizeFeature(key),1.)
+        self.tom.setHorizon(2)
+        self.tom.setLookahead(0)
+        vector = self.world.state[None].domain()[0]
+        for actions in [[self.hit,self.chase],[self.chase,self.hit]]:
+            self.tom.setPruning(False)
+            exact = self.tom.decide(vector,actions=actions,selection='consistent')
+            self.tom.setPruning()
+            decision = self.tom.decide(vector,actions=actions,selection='consistent')
+            self.assertEqual(decision['action'],exact['action'])
+            self.assertEqual(decision['V*'],exact['V*'])
+            self.assertNotIn('pruned',decision)
+
+    def testExecutor(self):
+        self.addStates()
+        self.addActions()
+        self.addDynamics()
+        self.world.setOrder([self.tom.name])
+        self.tom.setReward(minimizeFeature(stateKey(self.jerry.name,'health')),1.)
+        self.tom.setHorizon(2)
+        self.tom.setBelief(stateKey(self.jerry.name,'health'),Distribution({50: 0.5,20: 0.5}))
+        vector = self.world.state[None].domain()[0]
+        serial = self.tom.decide(vector)
+        self.tom.getLookahead(True).clear()
+        self.world.setExecutor(2)
+        try:
+            decision = self.tom.decide(vector)
+            self.assertEqual(decision['action'],serial['action'])
+            self.assertEqual(decision['V*'],serial['V*'])
+            self.assertEqual(set(decision['V'].keys()),set(serial['V'].keys()))
+            for action in serial['V']:
+                self.assertEqual(decision['V'][action]['__EV__'],serial['V'][action]['__EV__'])
+            # Values cached by the workers
+            self.assertGreater(len(self.tom.getLookahead(True)),0)
+            # Changing the beliefs between steps brings the workers up to date
+            pool = self.world.executor.pool
+            self.tom.setBelief(stateKey(self.jerry.name,'health'),Distribution({50: 0.5,80: 0.5}))
+            self.tom.getLookahead(True).clear()
+            decision = self.tom.decide(vector)
+            self.assertIsNot(self.world.executor.pool,pool)
+            self.world.setExecutor(0)
+            self.tom.getLookahead(True).clear()
+            serial = self.tom.decide(vector)
+            self.assertEqual(decision['V*'],serial['V*'])
+            # Threads work on forks of the world
+            self.tom.getLookahead(True).clear()
+            self.world.setExecutor(2,threads=True)
+            decision = self.tom.decide(vector)
+            self.assertEqual(decision['action'],serial['action'])
+            self.assertEqual(decision['V*'],serial['V*'])
+            self.world.step()
+            self.assertIsNone(self.world.executor.pool)
+        finally:
+            self.world.setExecutor(0)
+        self.assertIsNone(self.world.executor)
+
+    def testBudget(self):
+        self.addStates()
+        self.addActions()
+        self.addDynamics()
+        self.world.setOrder([self.tom.name])
+        self.tom.setReward(minimizeFeature(stateKey(self.jerry.name,'health')),1.)
+        self.tom.setHorizon(3)
+        vector = self.world.state[None].domain()[0]
+        exact = self.tom.decide(vector)
+        self.assertNotIn('horizon',exact)
+        decision = self.tom.decide(vector,budget=60.)
+        self.assertEqual(decision['horizon'],3)
+        self.assertEqual(decision['V*'],exact['V*'])
+        self.tom.setBudget(0.)
+        # Previously computed values take no time
+        self.assertEqual(self.tom.decide(vector)['horizon'],3)
+        self.tom.setLookahead(0)
+        decision = self.tom.decide(vector)
+        self.assertEqual(decision['horizon'],0)
+        self.assertIsNone(self.world.deadline)
+        doc = self.tom.__xml__()
+        self.assertEqual(Agent(doc.documentElement).models[True]['budget'],0.)
+        self.tom.setBudget(None)
+        self.assertNotIn('horizon',self.tom.decide(vector))
+
     def testRewardOnOthers(self):
         self.addStates()
         self.addActions()
@@ -256,6 +735,33 @@ class TestAgents(unittest.TestCase):
         vChase = self.tom.value(vector,self.chase)['V']
         self.assertAlmostEqual(vHit,vChase+.1,8)
 
+    def testActionRegistry(self):
+        self.addActions()
+        registry = self.world.actionRegistry
+        self.assertIn(self.chase,self.tom.actions)
+        self.assertIs(registry.intern(Action({'subject': self.tom.name,'verb': 'chase','object': self.jerry.name})),self.chase)
+        self.assertEqual(registry[registry.id(self.hit)],self.hit)
+        joint = self.chase | self.run
+        self.assertIsInstance(joint,ActionSet)
+        self.assertEqual(joint,ActionSet({self.tom.name: self.chase,self.jerry.name: self.run}))
+        self.assertEqual(hash(joint),hash(ActionSet(list(self.run)+list(self.chase))))
+
+    def testActionPickle(self):
+        self.addActions()
+        # Pickle an action set in a process with a different hash seed
+        script = 'import pickle,sys\n'\
+                 'from psychsim.action import Action,ActionSet\n'\
+                 'atom = Action({"subject": "Tom","verb": "chase","object": "Jerry"})\n'\
+                 'action = ActionSet([atom])\n'\
+                 'hash(action)\n'\
+                 'sys.stdout.buffer.write(pickle.dumps(action))\n'
+        env = dict(os.environ,PYTHONPATH=os.pathsep.join(sys.path),PYTHONHASHSEED='1')
+        action = pickle.loads(subprocess.check_output([sys.executable,'-c',script],env=env))
+        self.assertEqual(action,self.chase)
+        self.assertEqual(hash(action),hash(self.chase))
+        self.assertEqual({self.chase: True}[action],True)
+        self.assertEqual({action: True}[self.chase],True)
+
     def testReward(self):
         self.addStates()
         key = stateKey(self.jerry.name,'health')
@@ -310,6 +816,23 @@ class TestAgents(unittest.TestCase):
         self.assertEqual(vector[tTurn],1)
         self.assertEqual(vector[jTurn],0)
 
+    def testTurnOrder(self):
+        self.addStates()
+        self.addActions()
+        self.addDynamics()
+        self.world.setOrder([self.tom.name,self.jerry.name])
+        for t in range(4):
+            self.assertEqual(self.world.next(),[[self.tom.name],[self.jerry.name]][t % 2])
+            self.world.step()
+        # Default turn order does not add to the dynamics
+        self.assertEqual([key for key in self.world.dynamics if isTurnKey(key)],[])
+        self.assertEqual(len(self.world.turnDeltas),2)
+        self.world.setOrder([{self.tom.name,self.jerry.name}])
+        for t in range(2):
+            self.assertEqual(set(self.world.next()),{self.tom.name,self.jerry.name})
+            self.world.step()
+        self.assertEqual(len(self.world.turnDeltas),3)
+
     def testStatic(self):
         self.addStates()
         self.addActions()
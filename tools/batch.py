@@ -0,0 +1,200 @@
+"""
+Module for running batches of independent simulations in parallel across a pool of processes
+Run with -h to get usage information
+"""
+import argparse
+import math
+import multiprocessing
+import queue
+import random
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from psychsim.world import World,isTurnKey
+
+# Per-process settings, inherited by the worker processes when the pool forks
+_scenario = None
+_summarize = None
+_measure = None
+_updates = None
+_steps = None
+# Per-process cache of loaded worlds, indexed by factory arguments
+_worlds = {}
+
+def summarizeStep(world,outcomes):
+    """
+    Default summary of a single simulation step
+    @return: the joint actions performed in each possible world
+    @rtype: dict
+    """
+    return {'actions': [str(outcome['actions']) for outcome in outcomes if 'actions' in outcome]}
+
+def measureState(world):
+    """
+    Default measurement of the final state of a simulation run
+    @return: the expected value of each numeric state feature (other than turn order)
+    @rtype: strS{->}float
+    """
+    result = {}
+    for key,entry in world.variables.items():
+        if entry['domain'] in (int,float) and not isTurnKey(key) and world.state[None].hasColumn(key):
+            result[key] = float(world.getFeature(key).expectation())
+    return result
+
+def aggregate(results):
+    """
+    @param results: the results of the individual runs, as returned by L{runBatch}
+    @type results: dict[]
+    @return: the count, mean, standard deviation, minimum, and maximum of each measurement across the runs
+    @rtype: strS{->}strS{->}float
+    """
+    values = {}
+    for result in results:
+        for name,value in result['measures'].items():
+            try:
+                values[name].append(value)
+            except KeyError:
+                values[name] = [value]
+    stats = {}
+    for name,series in values.items():
+        mean = sum(series)/len(series)
+        stats[name] = {'count': len(series),
+                       'mean': mean,
+                       'std': math.sqrt(sum([(value-mean)**2 for value in series])/len(series)),
+                       'min': min(series),
+                       'max': max(series)}
+    return stats
+
+def loadWorld(args):
+    """
+    @param args: the keyword arguments to pass to the world factory (ignored if the scenario is a file)
+    @type args: dict
+    @return: the world for the given arguments, loaded only once per process
+    @rtype: L{World}
+    """
+    index = tuple(sorted(args.items()))
+    try:
+        return _worlds[index]
+    except KeyError:
+        pass
+    if isinstance(_scenario,World):
+        world = _scenario
+    elif callable(_scenario):
+        world = _scenario(**args)
+    else:
+        world = World(_scenario)
+    _worlds[index] = world
+    return world
+
+def _initialize(scenario,summarize,measure,updates,steps):
+    global _scenario,_summarize,_measure,_updates,_steps
+    _scenario = scenario
+    _summarize = summarize
+    _measure = measure
+    _updates = updates
+    _steps = steps
+    _worlds.clear()
+
+def _run(run,config,seed):
+    """
+    Performs a single run, streaming a summary of each step back to the parent
+    @return: the result of the run
+    @rtype: dict
+    """
+    world = loadWorld(config.get('args',{})).fork()
+    world.seed(seed)
+    if numpy is not None:
+        numpy.random.seed(seed % (1 << 32))
+    for key,value in config.get('state',{}).items():
+        world.setFeature(key,value)
+    horizon = config.get('steps',_steps)
+    t = 0
+    while (horizon is None or t < horizon) and not world.terminated():
+        outcomes = world.step()
+        summary = _summarize(world,outcomes)
+        summary['step'] = t
+        _updates.put((run,summary))
+        t += 1
+    # Tell the parent that there will be no more summaries for this run
+    _updates.put((run,None))
+    return {'run': run,
+            'seed': seed,
+            'steps': t,
+            'measures': _measure(world)}
+
+def runBatch(scenario,configs,steps=None,processes=None,seed=None,
+             summarize=summarizeStep,measure=measureState,callback=None):
+    """
+    Performs independent simulation runs in parallel
+    @param scenario: a scenario file name, a L{World}, or a function that creates a L{World} (given the C{args} of a run configuration)
+    @param configs: the configuration of each run, with any of the following entries:
+       - args: the keyword arguments to pass to the world factory (default is none)
+       - state: table of state feature values to set before the run (default is none)
+       - steps: the maximum number of steps in the run (default is the C{steps} argument)
+       - seed: the seed for the world's random number generator in the run (see L{World.seed}), default is derived from the C{seed} argument
+    @type configs: dict[]
+    @param steps: the maximum number of steps in each run, where C{None} means run until termination (default is C{None})
+    @type steps: int
+    @param processes: the number of worker processes (default is the number of CPUs)
+    @type processes: int
+    @param seed: the seed from which per-run seeds are derived (default is a random seed)
+    @type seed: int
+    @param summarize: the function summarizing each step, given the world and the step outcomes (default is L{summarizeStep})
+    @param measure: the function measuring the final state of each run (default is L{measureState})
+    @param callback: a function called in the parent process on the run index and summary of each step, as they arrive (default is none)
+    @return: the result of each run (in the order of the configurations), and the aggregate statistics across them (see L{aggregate})
+    @rtype: dict[],dict
+    @note: worker processes are forked, so the scenario and functions need not be picklable, but any worlds created in the workers are not seen by the parent
+    """
+    if seed is None:
+        seed = random.randrange(1 << 31)
+    context = multiprocessing.get_context('fork')
+    updates = context.Queue()
+    pool = context.Pool(processes,_initialize,(scenario,summarize,measure,updates,steps))
+    try:
+        pending = [pool.apply_async(_run,(run,config,config.get('seed',seed+run)))
+                   for run,config in enumerate(configs)]
+        remaining = len(pending)
+        while remaining > 0:
+            try:
+                run,summary = updates.get(timeout=0.1)
+            except queue.Empty:
+                for result in pending:
+                    if result.ready() and not result.successful():
+                        # Raise the worker's exception
+                        result.get()
+                continue
+            if summary is None:
+                remaining -= 1
+            elif callback is not None:
+                callback(run,summary)
+        results = [result.get() for result in pending]
+    finally:
+        pool.close()
+        pool.join()
+    return results,aggregate(results)
+
+if __name__ == '__main__':
+    # Command-line arguments
+    parser = argparse.ArgumentParser(description='Run independent simulations of a PsychSim scenario in parallel')
+    parser.add_argument('scenario',help='scenario file')
+    parser.add_argument('-n','--runs',type=int,default=10,help='number of runs')
+    parser.add_argument('-s','--steps',type=int,default=None,help='maximum number of steps per run')
+    parser.add_argument('-p','--processes',type=int,default=None,help='number of worker processes')
+    parser.add_argument('--seed',type=int,default=None,help='seed for the per-run random number generators')
+    parser.add_argument('-v','--verbose',action='store_true',help='print summary of each step')
+    args = parser.parse_args()
+    if args.verbose:
+        callback = lambda run,summary: print(run,summary['step'],' '.join(summary['actions']),file=sys.stderr)
+    else:
+        callback = None
+    results,stats = runBatch(args.scenario,[{} for run in range(args.runs)],args.steps,
+                             args.processes,args.seed,callback=callback)
+    for name in sorted(stats.keys()):
+        entry = stats[name]
+        print('%s\t%d\t%f\t%f\t%f\t%f' % (name,entry['count'],entry['mean'],entry['std'],
+                                          entry['min'],entry['max']))
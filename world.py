@@ -2,12 +2,21 @@ import bz2
 import copy
 
 import io
+import random
 from xml.dom.minidom import Document,Node,parseString
 
-from .action import ActionSet,Action
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .action import ActionSet,Action,ActionRegistry
 from .pwl import *
 from .probability import Distribution
 from .agent import Agent
+from .cache import LRUCache
+from .history import RingHistory,LogHistory
+from .parallel import Executor
 
 class World:
     """
@@ -19,16 +28,61 @@ class World:
     @type variables: dict
     @ivar symbols: utility storage of symbols used across all enumerated state variables
     @type symbols: strS{->}int
+    @ivar actionRegistry: the canonical instances of the action sets used in this world
+    @type actionRegistry: L{ActionRegistry}
     @ivar dynamics: table of action effect models
     @type dynamics: dict
     @ivar dependency: table of dependencies among state features that impose temporal constraints
     @type dependency: dict
-    @ivar history: accumulated list of outcomes from simulation steps
-    @type history: list
     @ivar termination: list of conditions under which the simulation terminates (default is none)
     @type termination: L{KeyedTree}[]
+    @ivar terminal: memo of the results of L{terminated}, indexed by the values of the keys referenced by the termination conditions (see L{getTerminationKeys})
+    @type terminal: L{LRUCache}
+    @ivar clamped: the numeric state features guaranteed to stay within their declared ranges, because their values were set within range and all of their dynamics enforce both the floor and the ceiling (see L{scaledBounds})
+    @type clamped: set
+    @ivar features: column assignment for all state features, used by any L{ArrayVector} state vectors
+    @type features: L{FeatureIndex}
+    @ivar dispatch: cache of the results of L{getDynamics}, indexed by state feature and then by L{ActionSet} (bounded by L{dispatchSize})
+    @type dispatch: strS{->}L{LRUCache}
+    @ivar desymbolized: cache of the dynamics trees instantiated for the parameters of each parameterized action, indexed by state feature and then by the (single-atom) L{ActionSet} (bounded by L{dispatchSize})
+    @type desymbolized: strS{->}L{LRUCache}
+    @ivar turnDeltas: cache of the default turn order updates computed by L{deltaOrder}, indexed by the agents following the default order, the agents among them who have just acted on their turn, and L{maxTurn}
+    @type turnDeltas: dict
+    @ivar compiled: cache of dynamics trees compiled over L{features}, indexed by tree id (bounded by L{dispatchSize})
+    @type compiled: L{LRUCache}
+    @ivar transitions: cache of the results of L{effect}, if turned on by L{cacheTransitions} (default is C{None})
+    @type transitions: L{LRUCache}
+    @ivar approximation: the settings for bounding the support of the state distribution after each real step (see L{setApproximation}), default is none
+    @type approximation: dict
+    @ivar discarded: the total probability mass discarded by approximating the state distribution across all real steps so far
+    @type discarded: float
+    @ivar particles: the number of particles representing the state distribution in particle mode (see L{setParticles}), or C{None} if not in particle mode (default)
+    @type particles: int
+    @ivar rng: the source of random numbers for all sampling within this world (see L{seed})
+    @type rng: C{random.Random}
+    @ivar randomSeed: the seed of L{rng}, from which the seeds of any child streams are derived (see L{stream})
+    @type randomSeed: int
+    @ivar deadline: the time by which the agent decision in progress must be made, if it has a time budget (see L{Agent.deepen}), otherwise C{None}
+    @type deadline: float
+    @ivar executor: the pool of workers across which agents compute the values of their action choices, if turned on by L{setExecutor} (default is C{None})
+    @type executor: L{Executor}
+    @ivar revision: a count of the changes made to the state, beliefs, dynamics, and agent models through L{setFeature}, L{setDynamics}, L{Agent.setReward}, and L{Agent.setAttribute}, by which L{executor} knows when its workers' copies of this world are out of date
+    @type revision: int
+    @ivar history: the outcomes of each real step so far, if L{memory} is on; a list by default, or a bounded or on-disk sink (see L{setHistory})
+    @type history: list
+    @cvar memory: if C{True}, then L{step} records the outcomes of each real step in L{history} (default is C{True})
+    @type memory: bool
+    @cvar explanation: how much of each agent decision to record in the step outcomes, either C{'action'}, C{'value'}, or C{'projection'} (default), see L{Agent.decide}
+    @type explanation: str
+    @cvar batch: if C{True}, then L{step} computes the dynamics of all possible worlds together (see L{stepBatch}); otherwise, it steps each possible world separately (default is C{False})
+    @type batch: bool
+    @cvar dispatchSize: the maximum number of action sets per state feature for which L{dispatch} and L{desymbolized} keep the resolved dynamics, and of trees kept in L{compiled} (default is 1024)
+    @type dispatchSize: int
     """
     memory = True
+    batch = False
+    explanation = 'projection'
+    dispatchSize = 1024
 
     def __init__(self,xml=None):
         """
@@ -43,21 +97,40 @@ class World:
         self.locals = {}
         self.symbols = {}
         self.symbolList = []
+        self.actionRegistry = ActionRegistry()
         self.termination = []
+        self.terminal = LRUCache(4096)
+        self.terminationKeys = None
         self.relations = {}
+        self.clamped = set()
+        self.features = None
 
         self.maxTurn = None
 
         # Action effect information
         self.dynamics = {}
+        self.dispatch = {}
+        self.desymbolized = {}
+        self.turnDeltas = {}
+        self.compiled = LRUCache(self.dispatchSize)
+        self.transitions = None
+        self.approximation = {}
+        self.discarded = 0.
+        self.particles = None
         self.dependency = {}
         self.graph = {}
         self.evaluationOrder = [set()]
 
         self.history = []
+        self.deadline = None
+        self.executor = None
+        self.revision = 0
 
         self.diagram = None
 
+        self.rng = random.Random()
+        self.seed()
+
         if isinstance(xml,Node):
             self.parse(xml)
         elif isinstance(xml,str) or isinstance(xml,str):
@@ -81,13 +154,64 @@ class World:
         self.relations.clear()
         self.symbols.clear()
         del self.symbolList[:]
+        self.actionRegistry.clear()
         self.dynamics.clear()
+        self.dispatch.clear()
+        self.desymbolized.clear()
+        self.turnDeltas.clear()
+        self.compiled.clear()
+        self.clearTransitions()
+        self.approximation.clear()
+        self.discarded = 0.
         self.dependency.clear()
         del self.evaluationOrder[:]
         self.evaluationOrder.append(set())
-        del self.history[:]
+        self.history.clear()
         del self.termination[:]
+        self.clearTermination()
         self.state.clear()
+        self.clamped.clear()
+        self.features = None
+
+    def fork(self):
+        """
+        Creates an independent copy of this world for hypothetical reasoning, without the cost of reloading the scenario
+        @note: the copy shares the trees, symbols, and other structures that do not change during simulation with this world, but has its own state, agent models (including beliefs and value caches), caches, random number generators, and (initially empty) history
+        @rtype: L{World}
+        """
+        world = copy.copy(self)
+        world.state = {name: dist.__class__(dist) for name,dist in self.state.items()}
+        world.variables = dict(self.variables)
+        world.locals = {name: dict(table) for name,table in self.locals.items()}
+        world.symbols = dict(self.symbols)
+        world.symbolList = list(self.symbolList)
+        world.termination = list(self.termination)
+        world.terminal = LRUCache(self.terminal.size)
+        world.relations = {name: dict(table) for name,table in self.relations.items()}
+        world.dynamics = {key: dict(table) for key,table in self.dynamics.items()}
+        world.dispatch = {key: copy.copy(table) for key,table in self.dispatch.items()}
+        world.desymbolized = {key: copy.copy(table) for key,table in self.desymbolized.items()}
+        world.turnDeltas = dict(self.turnDeltas)
+        world.compiled = copy.copy(self.compiled)
+        if self.transitions is not None:
+            world.transitions = LRUCache(self.transitions.size)
+        world.approximation = dict(self.approximation)
+        world.clamped = set(self.clamped)
+        world.dependency = {key: dict(table) for key,table in self.dependency.items()}
+        # Rebuilt on demand
+        world.graph = {}
+        world.evaluationOrder = [set(keys) for keys in self.evaluationOrder]
+        # A fork records only its own steps, in a sink bounded like mine (but never on disk)
+        if isinstance(self.history,RingHistory):
+            world.history = RingHistory(self.history.size)
+        else:
+            world.history = []
+        if self.executor is not None:
+            world.executor = Executor(world,self.executor.processes,self.executor.threads)
+        world.rng = random.Random()
+        world.rng.setstate(self.rng.getstate())
+        world.agents = {name: agent.fork(world) for name,agent in self.agents.items()}
+        return world
 
     """------------------"""
     """Simulation methods"""
@@ -105,14 +229,19 @@ class World:
         """
         if state is None:
             state = self.state[None]
-        outcomes = []
-        # Iterate through each possible world
         oldStates = state.domain()
-        for stateVector in oldStates:
-            prob = state[stateVector]
-            outcome = self.stepFromState(stateVector,actions,keys=keys)
-            outcome['probability'] = prob
-            outcomes.append(outcome)
+        if self.particles:
+            outcomes = self.stepParticles(state,actions,keys)
+        elif self.batch:
+            outcomes = self.stepBatch(state,actions,keys)
+        else:
+            outcomes = []
+            # Iterate through each possible world
+            for stateVector in oldStates:
+                prob = state[stateVector]
+                outcome = self.stepFromState(stateVector,actions,keys=keys)
+                outcome['probability'] = prob
+                outcomes.append(outcome)
         if real:
             # Apply effects
             assert keys is None,'Cannot perform real step over a subset of keys'
@@ -123,7 +252,7 @@ class World:
                     continue
                 elif isinstance(outcome['new'],Distribution):
                     if select:
-                        new = outcome['new'].sample()
+                        new = outcome['new'].sample(rng=self.rng)
                         dist = [(new,1.)]
                     else:
                         dist = [(el,outcome['new'][el]) for el in outcome['new'].domain()]
@@ -145,14 +274,37 @@ class World:
                 msg = buf.getvalue()
                 buf.close()
                 raise RuntimeError(msg)
+            if self.approximation and not self.particles and not select:
+                self.discarded += self.approximate(state,**self.approximation)
             if self.memory:
                 self.history.append(outcomes)
             self.modelGC(False)
+            if self.executor is not None:
+                # Any worker processes now have an out-of-date copy of this world
+                self.executor.refresh()
         return outcomes
 
-    def stepFromState(self,vector,actions=None,horizon=None,tiebreak=None,updateBeliefs=True,keys=None):
+    def stepFromState(self,vector,actions=None,horizon=None,tiebreak=None,updateBeliefs=True,keys=None,sample=False,explanation=None):
         """
         Compute the resulting states when starting in a given possible world (as opposed to a distribution over possible worlds)
+        @param sample: if C{True}, then compute a single resulting state, by sampling the agents' actions and any probabilistic effects (default is C{False})
+        @type sample: bool
+        @param explanation: how much of each agent decision to record in the outcome (default is L{explanation}), see L{Agent.decide}
+        @type explanation: str
+        """
+        outcome = self.chooseActions(vector,actions,horizon,tiebreak,sample,explanation)
+        if 'new' not in outcome:
+            self.applyActions(outcome,updateBeliefs,keys,sample=sample)
+        return outcome
+
+    def chooseActions(self,vector,actions=None,horizon=None,tiebreak=None,sample=False,explanation=None):
+        """
+        Determines the actions performed by the agents in a given possible world (the first half of L{stepFromState})
+        @param sample: if C{True}, then each agent chooses a single action sampled from its L{Agent.decide} distribution (default is C{False})
+        @param explanation: how much of each agent decision to record in the outcome (default is L{explanation}), see L{Agent.decide}
+        @type explanation: str
+        @return: the outcome of the step so far, with the new state already filled in if the world is already in a terminal state
+        @rtype: dict
         """
         outcome = {'old': vector,
                    'decisions': {}}
@@ -167,8 +319,6 @@ class World:
             if isinstance(actions,Action):
                 actions = ActionSet([actions])
             outcome['actions'] = copy.copy(actions)
-        # Keep track of whether there is uncertainty about the actions to perform
-        stochastic = []
         if not isinstance(outcome['actions'],ActionSet) and not isinstance(outcome['actions'],list):
             # ActionSet indicates that we should perform just these actions. 
             # Otherwise, we look at whose turn it is:
@@ -179,13 +329,34 @@ class World:
             for name in turn:
                 if name not in outcome['actions']:
                     model = self.getModel(name,vector)
-                    decision = self.agents[name].decide(vector,horizon,outcome['actions'],model,tiebreak)
+                    if sample and tiebreak is None:
+                        decision = self.agents[name].decide(vector,horizon,outcome['actions'],model,'distribution',explanation=explanation)
+                    else:
+                        decision = self.agents[name].decide(vector,horizon,outcome['actions'],model,tiebreak,explanation=explanation)
                     outcome['decisions'][name] = decision
-                    outcome['actions'][name] = decision['action']
+                    if sample and isinstance(decision['action'],Distribution):
+                        outcome['actions'][name] = decision['action'].sample(rng=self.agents[name].rng)
+                    else:
+                        outcome['actions'][name] = decision['action']
                 elif isinstance(outcome['actions'][name],Action):
                     outcome['actions'][name] = ActionSet([outcome['actions'][name]])
-                if isinstance(outcome['actions'][name],Distribution):
-                    stochastic.append(name)
+        return outcome
+
+    def applyActions(self,outcome,updateBeliefs=True,keys=None,new=None,sample=False,effects=None):
+        """
+        Computes the effects of the actions chosen by L{chooseActions} (the second half of L{stepFromState}), adding them to the given outcome
+        @param new: the distribution over new worlds already computed by L{deltaStateBatch} (default is to compute it here)
+        @type new: L{VectorDistribution}
+        @param effects: the per-layer effects computed by L{deltaStateBatch} along with C{new}
+        @type effects: L{MatrixDistribution}[]
+        @param sample: if C{True}, then sample a single effect at any probabilistic branch of the dynamics (default is C{False})
+        @type sample: bool
+        """
+        # Keep track of whether there is uncertainty about the actions to perform
+        if isinstance(outcome['actions'],dict):
+            stochastic = [name for name,action in outcome['actions'].items() if isinstance(action,Distribution)]
+        else:
+            stochastic = []
         if stochastic:
             # Merge effects of multiple possible actions into single effect
             if len(stochastic) > 1:
@@ -195,7 +366,7 @@ class World:
                 prob = outcome['actions'][stochastic[0]][action]
                 actions = dict(outcome['actions'])
                 actions[stochastic[0]] = action 
-                effect = self.effect(actions,outcome['old'],prob,updateBeliefs=updateBeliefs,keys=keys)
+                effect = self.effect(actions,outcome['old'],prob,updateBeliefs=updateBeliefs,keys=keys,sample=sample)
                 if len(effect) == 0:
                     # No consistent transition for this action (don't blame me, I'm just the messenger)
                     continue
@@ -210,7 +381,7 @@ class World:
                     outcome['new'] = effect['new']
                     outcome['effect'] = effect['effect']
         else:
-            effect = self.effect(outcome['actions'],outcome['old'],1.,updateBeliefs,keys)
+            effect = self.effect(outcome['actions'],outcome['old'],1.,updateBeliefs,keys,new,sample,effects)
             outcome.update(effect)
         if 'effect' in outcome:
             if 'new' not in outcome:
@@ -223,23 +394,106 @@ class World:
             pass
         return outcome
 
-    def effect(self,actions,vector,probability=1.,updateBeliefs=True,keys=None):
+    def stepParticles(self,state,actions=None,keys=None):
+        """
+        Computes a sampled outcome for each particle in the given state distribution, as in L{stepFromState} with C{sample=True}
+        @note: the given distribution is first resampled (systematically) into exactly n particles, for n L{particles}, so a particle of probability k/n is sampled k times; as each sample follows the dynamics themselves, the n outcomes are equally weighted
+        @type state: L{VectorDistribution}
+        @return: the outcome for each sample, each with probability 1/n
+        @rtype: dict[]
+        """
+        state = state.__class__(state)
+        state.resample(self.particles,self.rng)
+        outcomes = []
+        for stateVector in state.domain():
+            copies = int(round(state[stateVector]*self.particles))
+            for particle in range(copies):
+                outcome = self.stepFromState(stateVector,actions,keys=keys,sample=True)
+                outcome['probability'] = 1./self.particles
+                outcomes.append(outcome)
+        return outcomes
+
+    def stepBatch(self,state,actions=None,keys=None):
+        """
+        Computes the same outcomes as calling L{stepFromState} on each possible world in the given distribution, but computes the state dynamics for all of the worlds performing the same joint action at once
+        @type state: L{VectorDistribution}
+        @return: the outcome for each possible world, in the order of C{state.domain()}
+        @rtype: dict[]
+        """
+        outcomes = []
+        groups = {}
+        for stateVector in state.domain():
+            outcome = self.chooseActions(stateVector,actions)
+            outcome['probability'] = state[stateVector]
+            outcomes.append(outcome)
+            if 'new' in outcome:
+                # Terminal state
+                continue
+            elif isinstance(outcome['actions'],dict):
+                if [action for action in outcome['actions'].values() if isinstance(action,Distribution)]:
+                    # Uncertain actions are expanded by applyActions
+                    self.applyActions(outcome,keys=keys)
+                    continue
+                joint = self.actionRegistry.intern(ActionSet(outcome['actions']))
+            else:
+                joint = self.actionRegistry.intern(outcome['actions'])
+            try:
+                groups[joint].append(outcome)
+            except KeyError:
+                groups[joint] = [outcome]
+        for joint,group in groups.items():
+            effects = [[] for outcome in group]
+            new = self.deltaStateBatch(group[0]['actions'],[outcome['old'] for outcome in group],effects,keys)
+            for position,outcome in enumerate(group):
+                self.applyActions(outcome,keys=keys,new=new[position],effects=effects[position])
+        return outcomes
+
+    def effect(self,actions,vector,probability=1.,updateBeliefs=True,keys=None,new=None,sample=False,effects=None):
         """
         @param probability: the likelihood of this particular action set (default is 100%)
         @type probability: float
+        @param new: the result of L{deltaState} on this vector, if already computed (default is C{None})
+        @type new: L{VectorDistribution}
+        @param effects: the per-layer effects recorded by L{deltaState} in computing C{new}
+        @type effects: L{MatrixDistribution}[]
+        @param sample: if C{True}, then compute a single sampled effect, rather than the distribution over all of them (default is C{False})
+        @type sample: bool
+        """
+        vector = vector.freeze()
+        if self.transitions is None or new is not None or sample:
+            return self.computeEffect(actions,vector,probability,updateBeliefs,keys,new,sample,effects)
+        if keys is not None:
+            keys = frozenset(keys)
+        index = (vector,self.actionRegistry.intern(actions),keys,updateBeliefs)
+        result = self.transitions.get(index)
+        if result is None:
+            result = self.computeEffect(actions,vector,1.,updateBeliefs,keys)
+            self.transitions[index] = result
+        # Callers modify the result, so hand out a copy
+        result = dict(result)
+        if 'new' in result:
+            result['new'] = VectorDistribution({new: probability*result['new'][new] for new in result['new'].domain()})
+            result['effect'] = list(result['effect'])
+        return result
+
+    def computeEffect(self,actions,vector,probability=1.,updateBeliefs=True,keys=None,new=None,sample=False,effects=None):
+        """
+        Computes the result of L{effect}, without consulting the transition cache
         """
         result = {'effect': [],
                   'new': VectorDistribution({vector: probability})}
-        result['new'] = self.deltaState(actions,result['new'],result['effect'],keys)
+        if new is None:
+            result['new'] = self.deltaState(actions,result['new'],result['effect'],keys,sample)
+        else:
+            result['new'] = new
+            result['effect'] += effects
         # Update turn order
         delta = self.deltaOrder(actions,vector)
         if delta:
             result['effect'].append(delta)
             new = VectorDistribution()
             for old in result['new'].domain():
-                newVector = KeyedVector(old)
-                newVector.update(delta*old)
-                new.addProb(newVector,result['new'][old])
+                new.addProb(old.alter(delta*old),result['new'][old])
             result['new'] = new
         # Update agent models included in the original world (after finding out possible new worlds)
         agentsModeled = [name for name in list(self.agents.keys()) if modelKey(name) in vector and \
@@ -262,6 +516,8 @@ class World:
                     else:
                         # Imperfect beliefs need to be updated
                         omegaDistribution = agent.observe(newVector,actions)
+                        if sample and len(omegaDistribution) > 1:
+                            omegaDistribution = VectorDistribution({omegaDistribution.sample(rng=self.rng): 1.})
                         modelDistribution = MatrixDistribution()
                         if oldModel in result['SE %s' % (name)]:
                             raise NotImplementedError('Unable to re-merge beliefs')
@@ -287,20 +543,18 @@ class World:
                 result['effect'].append(delta)
                 new = VectorDistribution()
                 for old in result['new'].domain():
-                    newVector = KeyedVector(old)
                     for matrix in delta.domain():
-                        newVector.update(matrix*old)
-                        new.addProb(newVector,result['new'][old]*delta[matrix])
+                        new.addProb(old.alter(matrix*old),result['new'][old]*delta[matrix])
                 result['new'] = new
             else:
                 # No possible transition at all!
                 result.clear()
         return result
 
-    def multiDeltaVector(self,actions,old,keys):
+    def multiDeltaVector(self,actions,old,keys,sample=False):
         new = VectorDistribution({old: 1.})
         for key in keys:
-            partial = self.singleDeltaVector(actions,old,key)
+            partial = self.singleDeltaVector(actions,old,key,sample=sample)
             if isinstance(partial,KeyedVector):
                 if key in partial:
                     new.join(key,Distribution({partial[key]: 1.}))
@@ -308,9 +562,11 @@ class World:
                 new.join(key,partial.marginal(key))
         return new
 
-    def singleDeltaVector(self,actions,old,key,dynamics=None):
+    def singleDeltaVector(self,actions,old,key,dynamics=None,sample=False):
         """
         @type old: L{KeyedVector}
+        @param sample: if C{True}, then follow a single sampled child at any probabilistic branch of the dynamics (default is C{False})
+        @type sample: bool
         """
         assert isinstance(old,KeyedVector)
         if dynamics is None:
@@ -318,7 +574,10 @@ class World:
         if dynamics:
             if len(dynamics) == 1:
                 # Single effect
-                matrix = dynamics[0][old]
+                if sample:
+                    matrix = dynamics[0].sample(old,self.rng)
+                else:
+                    matrix = dynamics[0][old]
                 if matrix is None:
                     # Null effect
                     return old
@@ -326,8 +585,7 @@ class World:
                     newValue = matrix*old
                 if isinstance(newValue,KeyedVector):
                     # Deterministic effect
-                    new = KeyedVector(old)
-                    new.update(newValue)
+                    new = old.alter(newValue)
                 else:
                     # Stochastic effect
                     new = VectorDistribution({old: 1.})
@@ -345,12 +603,12 @@ class World:
                     # Iterate through each tree (possibly ordered)
                     if isinstance(old,KeyedVector):
                         # Certain state
-                        old = self.singleDeltaVector(actions,old,key,[tree])
+                        old = self.singleDeltaVector(actions,old,key,[tree],sample)
                     else:
                         # Uncertain state
                         new = VectorDistribution()
                         for oldVector in old.domain():
-                            partial = self.singleDeltaVector(actions,oldVector,key,[tree])
+                            partial = self.singleDeltaVector(actions,oldVector,key,[tree],sample)
                             if isinstance(partial,KeyedVector):
                                 # Deterministic effect
                                 new.addProb(partial,old[oldVector])
@@ -363,7 +621,7 @@ class World:
         else:
             return old
         
-    def deltaState(self,actions,old,effects,keys=None):
+    def deltaState(self,actions,old,effects,keys=None,sample=False):
         """
         Computes the change across a subset of state features
         """
@@ -371,19 +629,296 @@ class World:
             if not keys is None:
                 keySet = {k for k in keySet if k in keys}
             new = VectorDistribution()
+            transitions = []
             for oldVector in old.domain():
-                partial = self.multiDeltaVector(actions,oldVector,keySet)
+                partial = self.multiDeltaVector(actions,oldVector,keySet,sample)
                 for newVector in partial.domain():
                     new.addProb(newVector,old[oldVector]*partial[newVector])
+                    transitions.append((oldVector,newVector,old[oldVector]*partial[newVector]))
             old = new
-            effects.append(MatrixDistribution({KeyedMatrix(): 1.}))
+            effects.append(self.layerEffect(transitions))
         return new
 
+    def layerEffect(self,transitions):
+        """
+        @param transitions: the (old world, new world, probability) triples resulting from one layer of L{evaluationOrder}
+        @return: the distribution over the changes made in that layer, each a matrix setting the changed features to their new values
+        @rtype: L{MatrixDistribution}
+        """
+        effect = MatrixDistribution()
+        for old,new,prob in transitions:
+            matrix = KeyedMatrix({key: KeyedVector({CONSTANT: new[key]}) for key in new.keys()
+                                  if key not in old or old[key] != new[key]})
+            effect.addProb(matrix,prob)
+        if len(effect) == 0 or sum(effect.values()) == 0.:
+            return MatrixDistribution({KeyedMatrix(): 1.})
+        effect.normalize()
+        return effect
+
+    def deltaStateBatch(self,actions,vectors,effects,keys=None):
+        """
+        Computes the result of L{deltaState} for each of the given possible worlds, all of which perform the same actions, evaluating each dynamics tree on all of the worlds at once
+        @type vectors: L{KeyedVector}[]
+        @param effects: one list per given world, to which the effects of each layer of L{evaluationOrder} on that world are appended (as in L{deltaState})
+        @type effects: L{MatrixDistribution}[][]
+        @return: the distribution over new worlds for each of the given worlds
+        @rtype: L{VectorDistribution}[]
+        """
+        index = self.getFeatureIndex()
+        current = [VectorDistribution({vector.freeze(): 1.}) for vector in vectors]
+        for keySet in self.evaluationOrder:
+            if not keys is None:
+                keySet = {k for k in keySet if k in keys}
+            olds = [(world,old,current[world][old]) for world in range(len(current)) for old in current[world].domain()]
+            rows = vectors2matrix([entry[1] for entry in olds],index,numpy.nan)
+            values = {key: self.deltaValues(actions,[entry[1] for entry in olds],key,rows) for key in keySet}
+            current = [VectorDistribution() for world in current]
+            transitions = [[] for world in current]
+            for position,entry in enumerate(olds):
+                world,old,prob = entry
+                partial = VectorDistribution({old: 1.})
+                for key in keySet:
+                    value = values[key][position]
+                    if value is None:
+                        continue
+                    elif len(value) == 1 and key in old and old[key] == value.domain()[0]:
+                        # No change
+                        continue
+                    partial.join(key,value)
+                for newVector in partial.domain():
+                    current[world].addProb(newVector,prob*partial[newVector])
+                    transitions[world].append((old,newVector,prob*partial[newVector]))
+            for world in range(len(current)):
+                effects[world].append(self.layerEffect(transitions[world]))
+        return current
+
+    def deltaValues(self,actions,vectors,key,rows):
+        """
+        @param rows: the given vectors as rows of a 2-D array over the world's feature index (with C{nan} for absent keys)
+        @return: for each of the given vectors, the distribution over the new values for the given key (C{None} if there is no effect)
+        @rtype: L{Distribution}[]
+        """
+        dynamics = self.getDynamics(key,actions)
+        if len(dynamics) == 0:
+            return [None for vector in vectors]
+        elif len(dynamics) > 1:
+            # Sequential effects are evaluated one world at a time
+            result = []
+            for old in vectors:
+                partial = self.singleDeltaVector(actions,old,key,dynamics)
+                if not isinstance(partial,KeyedVector):
+                    result.append(partial.marginal(key))
+                elif key in partial:
+                    result.append(Distribution({partial[key]: 1.}))
+                else:
+                    result.append(None)
+            return result
+        compiled = self.compileDynamics(dynamics[0])
+        weights,pattern,linear = compiled.leafRows(key)
+        if rows.shape[1] < len(compiled.index):
+            rows = numpy.hstack((rows,numpy.full((len(rows),len(compiled.index)-rows.shape[1]),numpy.nan)))
+        positions,leaves,probs = compiled.evaluate(numpy.nan_to_num(rows,nan=0.))
+        # Apply the linear leaves to all rows at once
+        mask = ~numpy.isnan(rows[positions])
+        present = numpy.einsum('ij,ij->i',pattern[leaves],mask[:,:pattern.shape[1]]) > 0
+        totals = numpy.einsum('ij,ij->i',weights[leaves],numpy.nan_to_num(rows[positions,:weights.shape[1]],nan=0.))
+        result = [None for vector in vectors]
+        for entry in range(len(positions)):
+            position = positions[entry]
+            old = vectors[position]
+            leaf = compiled.leaves[leaves[entry]]
+            if linear[leaves[entry]]:
+                if present[entry]:
+                    value = float(totals[entry])
+                elif key in old:
+                    value = old[key]
+                else:
+                    continue
+            elif leaf is None:
+                if key in old:
+                    value = old[key]
+                else:
+                    continue
+            else:
+                newValue = old.alter(leaf*old)
+                if key not in newValue:
+                    continue
+                value = newValue[key]
+            if result[position] is None:
+                result[position] = Distribution()
+            result[position].addProb(value,float(probs[entry]))
+        return result
+
+    def compileDynamics(self,tree):
+        """
+        @return: the given dynamics tree compiled over this world's feature index (reusing any previous compilation)
+        @rtype: L{CompiledTree}
+        """
+        try:
+            return self.compiled[id(tree)][1]
+        except KeyError:
+            compiled = tree.compile(self.getFeatureIndex())
+            # Keep the tree itself, so that its id is not reused
+            self.compiled[id(tree)] = (tree,compiled)
+            return compiled
+
+    def cacheTransitions(self,size=1024):
+        """
+        Turns on (or off) the caching of transitions computed by L{effect}
+        @param size: the maximum number of transitions to keep (C{None} for no bound, 0 to turn caching off); default is 1024
+        @type size: int
+        """
+        if size == 0:
+            self.transitions = None
+        else:
+            self.transitions = LRUCache(size)
+
+    def clearTransitions(self):
+        """
+        Discards any cached transitions (e.g., because the dynamics have changed)
+        """
+        if self.transitions is not None:
+            self.transitions.clear()
+
+    def setApproximation(self,size=None,threshold=None,distance=None):
+        """
+        Bounds the support of the state distribution resulting from each real L{step} that does not select a single outcome (with no arguments, turns the approximation off)
+        @param size: the maximum number of possible worlds to keep
+        @type size: int
+        @param threshold: the minimum probability of any possible world to keep
+        @type threshold: float
+        @param distance: the distance (after L{scaleState}) within which possible worlds are merged
+        @type distance: float
+        """
+        self.approximation.clear()
+        for name,value in [('size',size),('threshold',threshold),('distance',distance)]:
+            if value is not None:
+                self.approximation[name] = value
+
+    def approximate(self,distribution,size=None,threshold=None,distance=None):
+        """
+        Compresses the given distribution over state vectors (in place), merging vectors by their distance after L{scaleState}
+        @type distribution: L{VectorDistribution}
+        @return: the probability mass discarded
+        @rtype: float
+        """
+        return distribution.approximate(size,threshold,distance,self.scaleState)
+
+    def seed(self,value=None):
+        """
+        Reseeds the random number generator of this world, as well as those of its agents
+        @param value: the new seed (default is a seed drawn from the C{random} module)
+        @type value: int
+        """
+        if value is None:
+            value = random.randrange(1 << 63)
+        self.randomSeed = value
+        self.rng.seed(value)
+        for name,agent in self.agents.items():
+            agent.rng = self.stream(name)
+
+    def stream(self,label):
+        """
+        @param label: the name of the stream (e.g., an agent name, or a run number)
+        @return: a new random number generator whose seed is derived from both my seed and the given label, so that it is independent of my own L{rng} and of any other streams
+        @rtype: C{random.Random}
+        """
+        return random.Random('%d/%s' % (self.randomSeed,label))
+
+    def setParticles(self,count=None):
+        """
+        Switches L{step} into particle mode, where the state distribution is a set of (at most) the given number of weighted particles, each advanced by sampling the agents' actions and the effects of the dynamics
+        @param count: the number of particles (C{None} turns particle mode off)
+        @type count: int
+        """
+        self.particles = count
+
+    def setHistory(self,size=None,filename=None,append=False):
+        """
+        Chooses where L{step} records its outcomes, replacing any steps recorded so far
+        @param size: the maximum number of most recent steps to keep in memory (default is C{None}, i.e., keep every step)
+        @type size: int
+        @param filename: if given, then append each step to a log in this file instead of keeping it in memory (see L{LogHistory})
+        @type filename: str
+        @param append: if C{True}, then keep any steps already logged in the given file (default is C{False})
+        @type append: bool
+        """
+        if isinstance(self.history,LogHistory):
+            self.history.close()
+        if filename is not None:
+            self.history = LogHistory(filename,append)
+        elif size is not None:
+            self.history = RingHistory(size)
+        else:
+            self.history = []
+        self.memory = True
+
+    def setExecutor(self,processes=None,threads=False):
+        """
+        Has agents compute the values of their action choices in parallel across a pool of workers (see L{Agent.decide})
+        @param processes: the number of workers, where 0 means compute all values in this process (default is the number of CPUs)
+        @type processes: int
+        @param threads: if C{True}, then the workers are threads sharing this process's memory, each with its own L{fork} of this world, which suits small worlds; otherwise, they are processes forked from this one (default is C{False})
+        @type threads: bool
+        @warning: the workers copy this world when first needed, and again after each real L{step} or change to L{revision}; any other changes made to the agents or dynamics of this world in between are not seen by the workers until L{Executor.refresh} is called
+        """
+        if self.executor is not None:
+            self.executor.close()
+        if processes == 0:
+            self.executor = None
+        else:
+            self.executor = Executor(self,processes,threads)
+
     def addTermination(self,tree):
         """
         Adds a possible termination condition to the list
         """
         self.termination.append(tree.desymbolize(self.symbols))
+        self.clearTransitions()
+        self.clearTermination()
+
+    def clearTermination(self):
+        """
+        Discards any memoized results of L{terminated} (e.g., because the termination conditions have changed)
+        """
+        self.terminal.clear()
+        self.terminationKeys = None
+
+    def updateTermination(self):
+        """
+        Rebuilds the referenced keys and the fused tree of the termination conditions, and discards the memo of L{terminated}, if the conditions have changed (whether through L{addTermination} or directly on the list) since they were last built
+        """
+        if self.terminationKeys is None or len(self.terminationKeys[0]) != len(self.termination) or \
+                [old for old,new in zip(self.terminationKeys[0],self.termination) if old is not new]:
+            self.terminal.clear()
+            keys = set()
+            for condition in self.termination:
+                keys |= condition.getKeysIn()
+            if self.termination:
+                # Each condition falls through to the rest wherever it is not satisfied
+                fused = self.termination[-1]
+                for condition in reversed(self.termination[:-1]):
+                    fused = condition.map(lambda leaf,rest=fused: leaf if leaf else rest)
+            else:
+                fused = None
+            # Keep the conditions themselves, so that replacing any one of them is noticed
+            self.terminationKeys = (tuple(self.termination),sorted(keys),fused)
+
+    def getTerminationKeys(self):
+        """
+        @return: the keys referenced by any of the termination conditions, in a fixed order
+        @rtype: str[]
+        """
+        self.updateTermination()
+        return self.terminationKeys[1]
+
+    def getTerminationTree(self):
+        """
+        @return: a single tree fusing all of the termination conditions, which is satisfied wherever any one of them is (C{None} if there are no conditions)
+        @rtype: L{KeyedTree}
+        """
+        self.updateTermination()
+        return self.terminationKeys[2]
 
     def terminated(self,state=None):
         """
@@ -403,18 +938,53 @@ class World:
                 return False
         if isinstance(state,VectorDistribution):
             # All possible worlds must be terminal states
-            for vector in state.domain():
-                if not self.terminated(vector):
-                    return False
-            else:
-                return True
+            return all(self.terminatedBatch(state))
         else:
             assert isinstance(state,KeyedVector)
-            for condition in self.termination:
-                if condition[state]:
-                    return True
-            else:
+            if len(self.termination) == 0:
                 return False
+            index = tuple([state.get(key) for key in self.getTerminationKeys()])
+            result = self.terminal.get(index)
+            if result is None:
+                result = bool(self.getTerminationTree()[state])
+                self.terminal[index] = result
+            return result
+
+    def terminatedBatch(self,vectors):
+        """
+        Evaluates each of the given state vectors with respect to termination conditions, routing all of those not already in L{terminal} through the compiled L{getTerminationTree} at once
+        @param vectors: the state vectors to evaluate
+        @type vectors: L{KeyedVector}[] or L{VectorDistribution}
+        @return: whether each state vector satisfies at least one termination condition
+        @rtype: bool[]
+        """
+        if isinstance(vectors,Distribution):
+            vectors = vectors.domain()
+        if len(self.termination) == 0:
+            return [False for vector in vectors]
+        keys = self.getTerminationKeys()
+        indices = [tuple([vector.get(key) for key in keys]) for vector in vectors]
+        result = [self.terminal.get(index) for index in indices]
+        missing = [position for position in range(len(vectors)) if result[position] is None]
+        if len(missing) > 1 and numpy is not None:
+            try:
+                compiled = self.compileDynamics(self.getTerminationTree())
+            except ValueError:
+                # Symbolic conditions are evaluated one world at a time
+                compiled = None
+            if compiled:
+                rows = vectors2matrix([vectors[position] for position in missing],self.getFeatureIndex())
+                flags = numpy.zeros(len(missing),dtype=bool)
+                positions,leaves,probs = compiled.evaluate(rows)
+                values = numpy.array([bool(leaf) for leaf in compiled.leaves])
+                flags[positions[values[leaves]]] = True
+                for position,flag in zip(missing,flags):
+                    result[position] = bool(flag)
+                    self.terminal[indices[position]] = result[position]
+        for position in missing:
+            if result[position] is None:
+                result[position] = self.terminated(vectors[position])
+        return result
 
     """-----------------"""
     """Authoring methods"""
@@ -427,6 +997,8 @@ class World:
             agent = Agent(agent)
         self.agents[agent.name] = agent
         agent.world = self
+        agent.rng = self.stream(agent.name)
+        agent.actions = {self.actionRegistry.intern(action) for action in agent.actions}
         return agent
 
     def has_agent(self,agent):
@@ -476,6 +1048,8 @@ class World:
                 action = Action(action)
             # Action -> ActionSet
             action = ActionSet([action])
+        if not action is True:
+            action = self.actionRegistry.intern(action)
         assert key in self.variables,'No state element "%s"' % (key) 
         if not action is True:
             for atom in action:
@@ -491,7 +1065,14 @@ class World:
         if enforceMax and self.variables[key]['domain'] in [int,float]:
             # Modify tree to enforce ceiling
             tree.ceil(key,self.variables[key]['hi'])
+        if not (enforceMin and enforceMax):
+            self.unclamp(key)
         self.dynamics[key][action] = tree
+        self.revision += 1
+        self.dispatch.pop(key,None)
+        self.desymbolized.pop(key,None)
+        self.compiled.clear()
+        self.clearTransitions()
 
     def getDynamics(self,key,action,state=None):
         if key not in self.dynamics:
@@ -501,6 +1082,25 @@ class World:
         elif not isinstance(action,ActionSet) and not isinstance(action,list):
             # Table of actions by multiple agents
             return self.getDynamics(key,ActionSet(action),state)
+        if isinstance(action,ActionSet) and isinstance(self.dynamics[key],dict):
+            try:
+                return self.dispatch[key][action]
+            except KeyError:
+                dynamics = self.resolveDynamics(key,action)
+                try:
+                    self.dispatch[key][action] = dynamics
+                except KeyError:
+                    self.dispatch[key] = LRUCache(self.dispatchSize)
+                    self.dispatch[key][action] = dynamics
+                return dynamics
+        return self.resolveDynamics(key,action)
+
+    def resolveDynamics(self,key,action):
+        """
+        Finds the dynamics trees for the given state feature and actions, without consulting L{dispatch}
+        @type action: L{ActionSet}
+        @rtype: L{KeyedTree}[]
+        """
         error = None
         try:
             return [self.dynamics[key][action]]
@@ -521,10 +1121,20 @@ class World:
                         except KeyError:
                             tree = None
                         if tree:
-                            table = {}
-                            for field in atom.getParameters():
-                                table[actionKey(field)] = atom[field]
-                            dynamics.append(tree.desymbolize(table))
+                            instance = ActionSet([atom])
+                            try:
+                                dynamics.append(self.desymbolized[key][instance])
+                            except KeyError:
+                                table = {}
+                                for field in atom.getParameters():
+                                    table[actionKey(field)] = atom[field]
+                                tree = tree.desymbolize(table)
+                                try:
+                                    self.desymbolized[key][instance] = tree
+                                except KeyError:
+                                    self.desymbolized[key] = LRUCache(self.dispatchSize)
+                                    self.desymbolized[key][instance] = tree
+                                dynamics.append(tree)
             if len(dynamics) == 0:
                 # No action-specific dynamics, fall back to default dynamics
                 if True in self.dynamics[key]:
@@ -595,12 +1205,13 @@ class World:
         if vector is None:
             assert len(self.state[None]) == 1,'Ambiguous state vector'
             vector = self.state[None].domain()[0]
-        items = [i for i in list(vector.items()) if isTurnKey(i[0])]
-        if len(items) == 0:
+        turns = [(name,vector.get(turnKey(name))) for name in self.agents]
+        turns = [(name,int(value)) for name,value in turns if value is not None]
+        if len(turns) == 0:
             # No turn information in vector
             return []
-        value = min([int(i[1]) for i in items])
-        return [turn2name(i[0]) for i in [i for i in items if int(i[1]) == value]]
+        value = min([turn for name,turn in turns])
+        return [name for name,turn in turns if turn == value]
 
     def deltaOrder(self,actions,vector):
         """
@@ -633,25 +1244,38 @@ class World:
                 actions.add(atom)
             actions = ActionSet(actions)
         # Find dynamics for each turn
-        delta = KeyedMatrix()
+        default = []
+        reset = set()
+        custom = KeyedMatrix()
         for name in potentials:
             key = turnKey(name)
             dynamics = self.getDynamics(key,actions,vector)
             if len(dynamics) == 0:
-                # Create default dynamics
-                if name in table:
-                    tree = makeTree({'if': thresholdRow(key,0.5),
-                                     True: incrementMatrix(key,-1),
-                                     False: setToConstantMatrix(key,self.maxTurn)})
+                # Default round robin: whoever acts on its turn goes to the back of the line, and everyone else moves up
+                default.append(name)
+                if name in table and vector[key] < 0.5:
+                    reset.add(name)
+            else:
+                # Combine any turn dynamics into single matrix
+                matrix = dynamics[0][vector]
+                assert isinstance(matrix,KeyedMatrix),'Dynamics must be deterministic'
+                custom.update(matrix)
+        index = (tuple(default),frozenset(reset),self.maxTurn)
+        try:
+            delta = self.turnDeltas[index]
+        except KeyError:
+            delta = KeyedMatrix()
+            for name in default:
+                if name in reset:
+                    delta.update(setToConstantMatrix(turnKey(name),self.maxTurn))
                 else:
-                    tree = makeTree(incrementMatrix(key,-1))
-                self.setTurnDynamics(name,actions,tree)
-                dynamics = [tree]
-            # Combine any turn dynamics into single matrix
-            matrix = dynamics[0][vector]
-            assert isinstance(matrix,KeyedMatrix),'Dynamics must be deterministic'
-            delta.update(matrix)
-        return delta
+                    delta.update(incrementMatrix(turnKey(name),-1))
+            self.turnDeltas[index] = delta
+        if custom:
+            custom.update(delta)
+            return custom
+        else:
+            return delta
 
     def getActions(self,vector,agents=None,actions=None):
         """
@@ -724,12 +1348,16 @@ class World:
                 lo = self.agents[key].actions
             self.variables[key].update({'elements': lo,'lo': None,'hi': None})
             for action in lo:
+                action = self.actionRegistry.intern(action)
                 self.symbols[action] = len(self.symbols)
                 self.symbolList.append(action)
                 assert self.symbolList[self.symbols[action]] == action
         else:
             raise ValueError('Unknown domain type %s for %s' % (domain,key))
         self.variables[key]['key'] = key
+        if domain is float or domain is int:
+            # No dynamics yet to leave the range
+            self.clamped.add(key)
         if evaluate:
             self.evaluationOrder[0].add(key)
 
@@ -745,7 +1373,17 @@ class World:
         assert key in self.variables,'Unknown element "%s"' % (key)
         if state is None:
             state = self.state[None]
-        state.join(key,self.value2float(key,value))
+        value = self.value2float(key,value)
+        self.revision += 1
+        if key in self.clamped:
+            if isinstance(value,Distribution):
+                values = value.domain()
+            else:
+                values = [value]
+            entry = self.variables[key]
+            if [element for element in values if element < entry['lo'] or element > entry['hi']]:
+                self.unclamp(key)
+        state.join(key,value)
 
     def encodeVariable(self,key,value):
         raise DeprecationWarning('Use value2float method instead')
@@ -949,6 +1587,8 @@ class World:
         """
         Garbage collect orphaned models.
         """
+        # Cached transitions may refer to the models about to be removed
+        self.clearTransitions()
         if check:
             # Record initial indices for verification purposes
             indices = {}
@@ -1064,7 +1704,7 @@ class World:
         @return: the normalized vector
         @rtype: L{KeyedVector}
         """
-        result = vector.__class__()
+        result = {}
         remaining = dict(vector)
         # Handle defined state features
         for key,entry in list(self.variables.items()):
@@ -1089,7 +1729,40 @@ class World:
             del remaining[CONSTANT]
         if remaining:
             raise NameError('Unprocessed keys: %s' % (list(remaining.keys())))
-        return result
+        return vector.__class__(result)
+
+    def unclamp(self,key):
+        """
+        Records that the given state feature may leave its declared range, discarding any reward bounds that relied on it (see L{Agent.rewardBounds})
+        """
+        if key in self.clamped:
+            self.clamped.discard(key)
+            for agent in self.agents.values():
+                for model in agent.models.values():
+                    model.pop('bounds',None)
+
+    def scaledBounds(self,key):
+        """
+        @return: the lowest and highest values that the given state feature can take in a vector normalized by L{scaleState}, or C{None} if unknown (including any numeric feature not in L{clamped})
+        @rtype: float,float
+        """
+        if key == CONSTANT:
+            return 1.,1.
+        try:
+            entry = self.variables[key]
+        except KeyError:
+            return None
+        if entry['domain'] is bool:
+            return 0.,1.
+        elif entry['domain'] is float or entry['domain'] is int:
+            if key in self.clamped:
+                return 0.,1.
+            else:
+                # The declared range is not enforced
+                return None
+        # Symbolic values are stored as their indices in the symbol table
+        values = [scaleValue(self.symbols[element],entry) for element in entry['elements']]
+        return float(min(values)),float(max(values))
 
     def reachable(self,state=None,transition=None,horizon=-1,ignore=[],debug=False):
         """
@@ -1145,6 +1818,34 @@ class World:
             mapping[self.scaleState(candidate)] = candidate
         return mapping[self.scaleState(vector).nearestNeighbor(list(mapping.keys()))]
 
+    def getFeatureIndex(self):
+        """
+        @return: the column assignment for all of the state features (including turns, models, and the constant term) in this world, extended to cover any features defined since the last call
+        @rtype: L{FeatureIndex}
+        """
+        if self.features is None:
+            self.features = FeatureIndex([CONSTANT])
+        for key in sorted(self.variables.keys()):
+            self.features.add(key)
+        for name in sorted(self.agents.keys()):
+            self.features.add(turnKey(name))
+            self.features.add(modelKey(name))
+        return self.features
+
+    def makeDense(self,state=None):
+        """
+        Converts a state distribution into an L{ArrayDistribution} of array-backed vectors over this world's feature index
+        @param state: the distribution to convert (default is the current world state, which is replaced by the result)
+        @type state: L{VectorDistribution}
+        @rtype: L{ArrayDistribution}
+        """
+        index = self.getFeatureIndex()
+        if state is None:
+            self.state[None] = ArrayDistribution(self.state[None],index)
+            return self.state[None]
+        else:
+            return ArrayDistribution(state,index)
+
     def getDescription(self,key,feature=None):
         if not feature is None:
             raise DeprecationWarning('Use key when calling getDescription, not entity/feature combination.')
@@ -1281,7 +1982,7 @@ class World:
                 # Explain lookahead
                 beliefs = [k for k in list(V.keys()) if not isinstance(k,str)]
                 for state in beliefs:
-                    nodes = V[state]['projection'][:]
+                    nodes = V[state].get('projection',[])[:]
                     while len(nodes) > 0:
                         node = nodes.pop(0)
                         tab = ''
@@ -1659,6 +2360,8 @@ class World:
                             assert subnode.tagName == 'table'
                             key = str(subnode.getAttribute('key'))
                             self.dynamics[key] = {}
+                            # Whether the dynamics enforced the range is not saved
+                            self.clamped.discard(key)
                             subsubnode = subnode.firstChild
                             action = True
                             while subsubnode:
@@ -1670,6 +2373,8 @@ class World:
                                         assert action is True
                                         action = ActionSet(subsubnode)
                                     elif subsubnode.tagName == 'tree':
+                                        if not action is True:
+                                            action = self.actionRegistry.intern(action)
                                         self.dynamics[key][action] = KeyedTree(subsubnode)
                                         action = True
                                     else: